@@ -2,7 +2,8 @@ from django.contrib import admin
 from .models import (
     ConfiguracionPagina, DatosPersonales, ExperienciaLaboral, 
     EstudioRealizado, ProductoAcademico, CategoriaTag, 
-    CursoCapacitacion, Reconocimiento, VentaGarage, Idioma
+    CursoCapacitacion, Reconocimiento, VentaGarage, Idioma,
+    MetadatosArchivo, TrabajoPDF
 )
 
 # --- GESTIÓN DE IDIOMAS (Inline) ---
@@ -92,4 +93,17 @@ class VentaGarageAdmin(admin.ModelAdmin):
 class ConfiguracionPaginaAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'mostrar_inicio', 'mostrar_perfil', 'mostrar_experiencia', 'mostrar_educacion', 'mostrar_contacto')
     def has_add_permission(self, request):
-        return not ConfiguracionPagina.objects.exists()
\ No newline at end of file
+        return not ConfiguracionPagina.objects.exists()
+
+@admin.register(MetadatosArchivo)
+class MetadatosArchivoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'es_pdf', 'paginas', 'tamano', 'cifrado', 'corrupto', 'fecha_analisis')
+    list_filter = ('es_pdf', 'cifrado', 'corrupto')
+    search_fields = ('nombre', 'hash_sha256')
+    readonly_fields = ('fecha_analisis',)
+
+@admin.register(TrabajoPDF)
+class TrabajoPDFAdmin(admin.ModelAdmin):
+    list_display = ('id', 'estado', 'fecha_creacion', 'fecha_inicio', 'fecha_fin')
+    list_filter = ('estado',)
+    readonly_fields = ('clave', 'banderas', 'base_url', 'ruta', 'error', 'fecha_creacion', 'fecha_inicio', 'fecha_fin', 'latido')
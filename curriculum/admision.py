@@ -0,0 +1,149 @@
+"""
+Control de admisión para la generación del PDF del CV.
+
+Cada generación (render con xhtml2pdf + fusión de anexos) ocupa CPU y memoria
+durante segundos; sin límite, varias descargas simultáneas dejan sin recursos
+a las páginas HTML. Los huecos de generación y de espera son archivos con
+`flock` en CV_ADMISION_DIR, así que el límite se comparte entre todos los
+workers de gunicorn y el sistema operativo libera el hueco si un proceso muere.
+
+- Hasta CV_RENDER_SIMULTANEOS generaciones a la vez.
+- Hasta CV_RENDER_COLA peticiones esperando turno, como mucho CV_RENDER_ESPERA segundos.
+- El resto recibe Saturado (la vista responde 503 con Retry-After).
+
+En plataformas sin fcntl (Windows) no se limita nada.
+"""
+import os
+import json
+import time
+import random
+from contextlib import contextmanager
+from django.conf import settings
+from .metricas import Cronometro
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Saturado(Exception):
+    """No hay hueco para generar el PDF ni sitio en la cola de espera."""
+
+
+def _abrir(nombre):
+    os.makedirs(settings.CV_ADMISION_DIR, exist_ok=True)
+    fd = os.open(os.path.join(settings.CV_ADMISION_DIR, nombre), os.O_RDWR | os.O_CREAT, 0o644)
+    return os.fdopen(fd, 'r+')
+
+
+def _tomar(prefijo, cantidad):
+    """Bloquea uno de los `cantidad` archivos libres y lo devuelve abierto, o None si están todos ocupados."""
+    for i in random.sample(range(cantidad), cantidad):
+        archivo = _abrir(f"{prefijo}-{i}.lock")
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return archivo
+        except BlockingIOError:
+            archivo.close()
+    return None
+
+
+def _soltar(archivo):
+    if archivo is not None:
+        fcntl.flock(archivo, fcntl.LOCK_UN)
+        archivo.close()
+
+
+def _contar(campo):
+    """Suma uno a un contador acumulado (admitidas, rechazadas), compartido entre procesos."""
+    with _abrir('contadores.json') as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+        contenido = archivo.read()
+        contadores = json.loads(contenido) if contenido else {}
+        contadores[campo] = contadores.get(campo, 0) + 1
+        archivo.seek(0)
+        archivo.truncate()
+        archivo.write(json.dumps(contadores))
+
+
+def _esperar_hueco(limite, con_cola):
+    hueco = _tomar('render', limite)
+    if hueco is not None:
+        return hueco
+
+    espera = None
+    if con_cola:
+        espera = _tomar('cola', settings.CV_RENDER_COLA) if settings.CV_RENDER_COLA > 0 else None
+        if espera is None:
+            _contar('rechazadas')
+            raise Saturado()
+    fin = time.monotonic() + settings.CV_RENDER_ESPERA
+    try:
+        while hueco is None:
+            if con_cola and time.monotonic() >= fin:
+                _contar('rechazadas')
+                raise Saturado()
+            time.sleep(0.1)
+            hueco = _tomar('render', limite)
+        return hueco
+    finally:
+        _soltar(espera)
+
+
+@contextmanager
+def turno(cronometro=None, con_cola=True):
+    """
+    Reserva un hueco de generación mientras dura el bloque.
+
+    Con con_cola=False (worker de trabajos en segundo plano) se espera sin
+    límite de tiempo y sin ocupar la cola de las peticiones web.
+    """
+    limite = settings.CV_RENDER_SIMULTANEOS
+    if fcntl is None or limite <= 0:
+        yield
+        return
+
+    with (cronometro or Cronometro()).etapa('admision'):
+        hueco = _esperar_hueco(limite, con_cola)
+    _contar('admitidas')
+    try:
+        yield
+    finally:
+        _soltar(hueco)
+
+
+def _ocupados(prefijo, cantidad):
+    ocupados = 0
+    for i in range(cantidad):
+        with _abrir(f"{prefijo}-{i}.lock") as archivo:
+            try:
+                fcntl.flock(archivo, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                fcntl.flock(archivo, fcntl.LOCK_UN)
+            except BlockingIOError:
+                ocupados += 1
+    return ocupados
+
+
+def estadisticas():
+    """Generaciones en curso y en espera ahora mismo, más los contadores acumulados."""
+    datos = {
+        'simultaneos': settings.CV_RENDER_SIMULTANEOS,
+        'max_cola': settings.CV_RENDER_COLA,
+        'espera_max_s': settings.CV_RENDER_ESPERA,
+    }
+    if fcntl is None or settings.CV_RENDER_SIMULTANEOS <= 0:
+        return {**datos, 'activo': False}
+
+    with _abrir('contadores.json') as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_SH)
+        contenido = archivo.read()
+    return {
+        **datos,
+        'activo': True,
+        'en_curso': _ocupados('render', settings.CV_RENDER_SIMULTANEOS),
+        'en_cola': _ocupados('cola', settings.CV_RENDER_COLA),
+        'admitidas': 0,
+        'rechazadas': 0,
+        **(json.loads(contenido) if contenido else {}),
+    }
@@ -0,0 +1,409 @@
+import io
+import os
+import mmap
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from pypdf import PdfReader
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import Sum
+from . import archivos
+from .models import MetadatosArchivo
+
+logger = logging.getLogger(__name__)
+
+_sesion = None
+_sesion_lock = threading.Lock()
+
+# Intentos de guardar los metadatos si la base de datos está bloqueada (SQLite
+# con otra escritura en curso)
+REINTENTOS_METADATOS = 5
+
+
+def sesion():
+    """Sesión HTTP compartida por el proceso: reutiliza conexiones keep-alive con el storage remoto."""
+    global _sesion
+    with _sesion_lock:
+        if _sesion is None:
+            s = requests.Session()
+            adaptador = HTTPAdapter(
+                pool_connections=settings.CV_ANEXOS_HILOS,
+                pool_maxsize=settings.CV_ANEXOS_HILOS,
+            )
+            s.mount('http://', adaptador)
+            s.mount('https://', adaptador)
+            _sesion = s
+    return _sesion
+
+
+class CacheAnexos:
+    """
+    Copia local de los anexos remotos, indexada por el nombre en el storage.
+
+    Cada entrada son dos archivos: el contenido (.bin) y sus metadatos (.json)
+    con el ETag / Last-Modified que devolvió el servidor. Mientras la entrada
+    esté fresca se usa sin tocar la red; después se revalida con una petición
+    condicional. El tamaño total está acotado y se descartan primero las
+    entradas usadas hace más tiempo (LRU por fecha de modificación).
+    """
+
+    def __init__(self, directorio, max_bytes, frescura):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.frescura = frescura
+        self._lock = threading.Lock()
+
+    def _rutas(self, nombre):
+        base = os.path.join(self.directorio, hashlib.sha256(nombre.encode()).hexdigest())
+        return base + '.bin', base + '.json'
+
+    def obtener(self, nombre):
+        """Devuelve (ruta del contenido, metadatos) o None si no hay copia local."""
+        ruta_bin, ruta_meta = self._rutas(nombre)
+        try:
+            with open(ruta_meta) as f:
+                meta = json.load(f)
+            os.utime(ruta_bin)
+        except (OSError, ValueError):
+            return None
+        return ruta_bin, meta
+
+    def es_fresca(self, meta):
+        return time.time() - meta.get('validado', 0) < self.frescura
+
+    def guardar(self, nombre, flujo, etag=None, last_modified=None):
+        """Copia el flujo (ya posicionado al inicio) a la caché y devuelve la ruta del contenido."""
+        ruta_bin, ruta_meta = self._rutas(nombre)
+        os.makedirs(self.directorio, exist_ok=True)
+        self._escribir(ruta_bin, flujo)
+        meta = {
+            'nombre': nombre,
+            'etag': etag,
+            'last_modified': last_modified,
+            'tamano': os.path.getsize(ruta_bin),
+            'validado': time.time(),
+        }
+        self._escribir(ruta_meta, json.dumps(meta).encode())
+        self._podar()
+        return ruta_bin
+
+    def revalidada(self, nombre, meta):
+        """El servidor respondió 304: la copia sigue vigente otro periodo de frescura."""
+        meta['validado'] = time.time()
+        self._escribir(self._rutas(nombre)[1], json.dumps(meta).encode())
+
+    def _escribir(self, ruta, datos):
+        with archivos.escritura_atomica(ruta) as f:
+            if isinstance(datos, bytes):
+                f.write(datos)
+            else:
+                shutil.copyfileobj(datos, f)
+
+    def _podar(self):
+        with self._lock:
+            entradas = []
+            for nombre in os.listdir(self.directorio):
+                if not nombre.endswith('.bin'):
+                    continue
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+                entradas.append((estado.st_mtime, estado.st_size, ruta))
+            total = sum(tamano for _, tamano, _ in entradas)
+            entradas.sort()
+            for _, tamano, ruta in entradas:
+                if total <= self.max_bytes:
+                    break
+                for borrar in (ruta, ruta[:-4] + '.json'):
+                    try:
+                        os.remove(borrar)
+                    except OSError:
+                        pass
+                total -= tamano
+
+
+_cache = None
+
+
+def cache_anexos():
+    global _cache
+    with _sesion_lock:
+        if _cache is None:
+            _cache = CacheAnexos(
+                settings.CV_ANEXOS_CACHE_DIR,
+                settings.CV_ANEXOS_CACHE_MAX_MB * 1024 * 1024,
+                settings.CV_ANEXOS_CACHE_FRESCURA,
+            )
+    return _cache
+
+
+class Anexo:
+    """
+    Resultado de leer un archivo adjunto: su contenido (en bytes, en un archivo
+    local ya preparado, `ruta`, o en un temporal, `flujo`) o el error que lo
+    impidió. `url` es la dirección pública del archivo, para enlazarlo si no se
+    puede incluir. `tamano_total` indica el tamaño real cuando solo se leyó el
+    comienzo del archivo (descargas que se cortan por no ser PDF).
+    """
+
+    def __init__(self, nombre, contenido=None, error=None, ruta=None, url=None, flujo=None, tamano_total=None):
+        self.nombre = nombre
+        self.contenido = contenido
+        self.error = error
+        self.ruta = ruta
+        self.url = url
+        self.flujo = flujo
+        self.tamano_total = tamano_total
+
+    def _cabecera(self):
+        if self.ruta:
+            with open(self.ruta, 'rb') as f:
+                return f.read(4)
+        if self.flujo:
+            posicion = self.flujo.tell()
+            self.flujo.seek(0)
+            cabecera = self.flujo.read(4)
+            self.flujo.seek(posicion)
+            return cabecera
+        return (self.contenido or b'')[:4]
+
+    @property
+    def es_pdf(self):
+        return self._cabecera() == b'%PDF'
+
+    @property
+    def tamano(self):
+        if self.tamano_total is not None:
+            return self.tamano_total
+        if self.ruta:
+            return os.path.getsize(self.ruta)
+        if self.flujo:
+            posicion = self.flujo.tell()
+            tamano = self.flujo.seek(0, os.SEEK_END)
+            self.flujo.seek(posicion)
+            return tamano
+        return len(self.contenido or b'')
+
+    def abrir(self):
+        """
+        Flujo binario para PdfReader / PdfWriter.append.
+
+        Los archivos en disco se proyectan en memoria (mmap): pypdf lee las
+        páginas directamente de la caché de páginas del sistema operativo, sin
+        copiar el archivo entero a un bytes de Python. Un `flujo` temporal se
+        entrega tal cual y se cierra al terminar de usarlo.
+        """
+        if self.ruta:
+            with open(self.ruta, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return io.BytesIO()
+                # El mapa sigue siendo válido después de cerrar el archivo
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.flujo:
+            self.flujo.seek(0)
+            return self.flujo
+        return io.BytesIO(self.contenido)
+
+
+def _recibir(nombre, response):
+    """
+    Descarga el cuerpo por bloques a un SpooledTemporaryFile (en memoria hasta
+    CV_ANEXOS_EN_MEMORIA_MB, después en disco).
+
+    Se corta en cuanto los primeros bytes no son de un PDF (un ZIP subido por
+    error no se descarga entero, sea del tamaño que sea) o el PDF supera
+    CV_ANEXOS_MAX_MB. El límite solo se aplica a los PDFs, que son los que se
+    fusionan: un archivo que no es PDF siempre vuelve como tal (es_pdf=False).
+    """
+    maximo = settings.CV_ANEXOS_MAX_MB * 1024 * 1024
+    declarado = response.headers.get('Content-Length', '')
+    declarado = int(declarado) if declarado.isdigit() else None
+
+    flujo = tempfile.SpooledTemporaryFile(max_size=settings.CV_ANEXOS_EN_MEMORIA_MB * 1024 * 1024)
+    cabecera = b''
+    total = 0
+    for bloque in response.iter_content(chunk_size=64 * 1024):
+        if len(cabecera) < 4:
+            cabecera += bloque[:4 - len(cabecera)]
+            if len(cabecera) == 4 and cabecera != b'%PDF':
+                break
+            if len(cabecera) == 4 and declarado is not None and declarado > maximo:
+                flujo.close()
+                return Anexo(nombre, error=f"Supera el tamaño máximo de {settings.CV_ANEXOS_MAX_MB} MB")
+        total += len(bloque)
+        if total > maximo:
+            flujo.close()
+            return Anexo(nombre, error=f"Supera el tamaño máximo de {settings.CV_ANEXOS_MAX_MB} MB")
+        flujo.write(bloque)
+
+    if cabecera != b'%PDF':
+        # Se descarta al fusionar; basta con el comienzo para saber que no es un PDF
+        flujo.close()
+        return Anexo(nombre, cabecera, tamano_total=declarado or 0)
+    flujo.seek(0)
+    return Anexo(nombre, flujo=flujo)
+
+
+def descargar(nombre, url):
+    """Descarga un anexo remoto pasando por la caché local y revalidando con ETag/Last-Modified."""
+    cache = cache_anexos()
+    entrada = cache.obtener(nombre)
+    cabeceras = {}
+    if entrada:
+        ruta, meta = entrada
+        if cache.es_fresca(meta):
+            return Anexo(nombre, ruta=ruta)
+        if meta.get('etag'):
+            cabeceras['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            cabeceras['If-Modified-Since'] = meta['last_modified']
+
+    with sesion().get(url, headers=cabeceras, timeout=settings.CV_ANEXOS_TIMEOUT, stream=True) as response:
+        if response.status_code == 304 and entrada:
+            cache.revalidada(nombre, meta)
+            return Anexo(nombre, ruta=ruta)
+        if response.status_code != 200:
+            return Anexo(nombre, error=f"HTTP {response.status_code}")
+        anexo = _recibir(nombre, response)
+
+    # Solo se guardan PDFs que quepan en la caché; desde ahí se usan igual que un archivo local
+    if anexo.flujo and anexo.tamano <= cache.max_bytes:
+        with anexo.flujo:
+            ruta = cache.guardar(
+                nombre, anexo.flujo,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+            )
+        return Anexo(nombre, ruta=ruta)
+    return anexo
+
+
+def _url(campo_archivo):
+    try:
+        return campo_archivo.url
+    except Exception:
+        return None
+
+
+def leer_anexo(campo_archivo):
+    url = _url(campo_archivo)
+    try:
+        if url and url.startswith('http'):
+            anexo = descargar(campo_archivo.name, url)
+        else:
+            try:
+                # FileSystemStorage: se trabaja sobre el archivo guardado, sin copiarlo
+                ruta = campo_archivo.path
+                os.stat(ruta)
+                anexo = Anexo(campo_archivo.name, ruta=ruta)
+            except NotImplementedError:
+                with campo_archivo.open('rb') as f:
+                    anexo = Anexo(campo_archivo.name, f.read())
+    except Exception as e:
+        anexo = Anexo(campo_archivo.name, error=str(e))
+    anexo.url = url
+    return anexo
+
+
+def leer_anexos(campos, limite=None):
+    """
+    Lee los archivos en paralelo con un número acotado de hilos.
+
+    Devuelve los resultados en el mismo orden que `campos`, que es el orden en
+    el que se fusionan en el PDF. Con `limite` (instante de time.monotonic) las
+    descargas remotas que no terminaron a tiempo vuelven como Anexo con error;
+    siguen en segundo plano y quedan en la caché para la próxima vez. Los
+    archivos locales no descargan nada (se proyectan con mmap al fusionar) y se
+    leen siempre, quede o no tiempo.
+    """
+    campos = [campo for campo in campos if campo]
+    remotos = {i for i, campo in enumerate(campos) if (_url(campo) or '').startswith('http')}
+    leidos = [None if i in remotos else leer_anexo(campo) for i, campo in enumerate(campos)]
+    if not remotos:
+        return leidos
+    pool = ThreadPoolExecutor(max_workers=min(settings.CV_ANEXOS_HILOS, len(remotos)))
+    try:
+        futuros = {i: pool.submit(leer_anexo, campos[i]) for i in remotos}
+        wait(futuros.values(), timeout=None if limite is None else max(0, limite - time.monotonic()))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    for i, futuro in futuros.items():
+        leidos[i] = (
+            futuro.result() if futuro.done() and not futuro.cancelled()
+            else Anexo(campos[i].name, error='Tiempo agotado', url=_url(campos[i]))
+        )
+    return leidos
+
+
+def analizar(campo_archivo):
+    """
+    Lee el archivo una vez y registra sus metadatos en MetadatosArchivo.
+
+    Si no se puede leer no se guarda nada, para reintentarlo en el siguiente
+    guardado. Si la base de datos sigue bloqueada tras REINTENTOS_METADATOS
+    se propaga el error; `manage.py analizar_anexos` completa los que falten.
+    """
+    anexo = leer_anexo(campo_archivo)
+    if anexo.error:
+        logger.warning("No se pudo analizar %s: %s", anexo.nombre, anexo.error)
+        return None
+
+    datos = {
+        'es_pdf': anexo.es_pdf,
+        'paginas': 0,
+        'tamano': anexo.tamano,
+        'cifrado': False,
+        'corrupto': False,
+    }
+    with anexo.abrir() as flujo:
+        # De los archivos que no son PDF solo se descargó el comienzo: no hay huella completa
+        if anexo.tamano_total is None:
+            huella = hashlib.sha256()
+            for bloque in iter(lambda: flujo.read(1024 * 1024), b''):
+                huella.update(bloque)
+            datos['hash_sha256'] = huella.hexdigest()
+        if anexo.es_pdf:
+            try:
+                flujo.seek(0)
+                lector = PdfReader(flujo)
+                # Muchos PDFs vienen "cifrados" con contraseña vacía y se abren sin problema
+                if lector.is_encrypted and not lector.decrypt(''):
+                    datos['cifrado'] = True
+                else:
+                    datos['paginas'] = len(lector.pages)
+            except Exception:
+                datos['corrupto'] = True
+
+    for intento in range(REINTENTOS_METADATOS):
+        try:
+            metadatos, _ = MetadatosArchivo.objects.update_or_create(nombre=anexo.nombre, defaults=datos)
+            return metadatos
+        except OperationalError:
+            if intento == REINTENTOS_METADATOS - 1:
+                raise
+            time.sleep(0.2 * 2 ** intento)
+
+
+def metadatos_de(campos):
+    """Metadatos ya calculados de los archivos indicados, en un diccionario nombre -> MetadatosArchivo."""
+    nombres = [campo.name for campo in campos if campo]
+    return {m.nombre: m for m in MetadatosArchivo.objects.filter(nombre__in=nombres)}
+
+
+def paginas_esperadas(nombres):
+    """Total de páginas que aportarán los archivos indicados, según su análisis previo."""
+    total = MetadatosArchivo.objects.filter(
+        nombre__in=[nombre for nombre in nombres if nombre],
+        es_pdf=True, cifrado=False, corrupto=False,
+    ).aggregate(total=Sum('paginas'))['total']
+    return total or 0
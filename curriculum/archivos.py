@@ -0,0 +1,63 @@
+"""
+Escritura y poda de los archivos de caché en disco (PDFs, paquetes, anexos,
+imágenes y recursos).
+
+Todo se escribe en un temporal del mismo directorio y se renombra al terminar
+(os.replace es atómico dentro de un sistema de archivos), así que ningún
+proceso lee nunca un archivo a medias.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def escritura_atomica(ruta, preparar=None):
+    """
+    Archivo binario abierto sobre un temporal junto a `ruta`.
+
+    Si el bloque termina sin errores se llama a `preparar(temporal)` (opcional,
+    por ejemplo para linealizar el PDF) y el temporal pasa a ser `ruta`. Si algo
+    falla el temporal se borra y la excepción sigue su curso.
+    """
+    directorio = os.path.dirname(ruta)
+    os.makedirs(directorio, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        if preparar is not None:
+            preparar(temporal)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def podar(directorio, max_archivos, extension=None):
+    """
+    Deja como mucho `max_archivos` en el directorio, borrando primero los de
+    fecha de modificación más antigua. Los temporales en curso no se tocan.
+    """
+    try:
+        nombres = os.listdir(directorio)
+    except OSError:
+        return
+    archivos = []
+    for nombre in nombres:
+        if nombre.endswith('.tmp') or (extension and not nombre.endswith(extension)):
+            continue
+        ruta = os.path.join(directorio, nombre)
+        try:
+            archivos.append((os.path.getmtime(ruta), ruta))
+        except OSError:
+            continue
+    sobrantes = len(archivos) - max_archivos
+    if sobrantes <= 0:
+        return
+    archivos.sort()
+    for _, ruta in archivos[:sobrantes]:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
@@ -0,0 +1,63 @@
+import os
+import hashlib
+from django.conf import settings
+from django.utils import timezone
+from . import archivos, versiones
+from .optimizar import linealizar
+from .models import (
+    DatosPersonales, Idioma, ExperienciaLaboral, EstudioRealizado,
+    CursoCapacitacion, Reconocimiento, ProductoAcademico, VentaGarage
+)
+
+# Modelos cuyo contenido aparece en el PDF (cuerpo o anexos)
+MODELOS_CV = (
+    DatosPersonales, Idioma, ExperienciaLaboral, EstudioRealizado,
+    CursoCapacitacion, Reconocimiento, ProductoAcademico, VentaGarage,
+)
+
+
+def clave_cv(banderas, base_url):
+    """
+    Huella del documento: banderas activas normalizadas + versión de los datos.
+
+    También entran la URL base (los enlaces a anexos la incluyen) y el año,
+    que aparece en el pie de página.
+    """
+    activas = ','.join(sorted(nombre for nombre, valor in banderas.items() if valor))
+    partes = [
+        activas,
+        base_url,
+        str(timezone.localdate().year),
+        versiones.version_datos(*MODELOS_CV),
+    ]
+    return hashlib.sha256('|'.join(partes).encode()).hexdigest()
+
+
+def _ruta(clave):
+    return os.path.join(settings.CV_PDF_CACHE_DIR, f"{clave}.pdf")
+
+
+def obtener(clave):
+    """Ruta del PDF ya generado para esta huella, o None si no existe."""
+    ruta = _ruta(clave)
+    try:
+        # Se actualiza la fecha para que la poda descarte primero los menos usados
+        os.utime(ruta)
+    except OSError:
+        return None
+    return ruta
+
+
+def guardar(clave, documento):
+    """
+    Vuelca el PdfWriter directamente al archivo de caché, sin una copia
+    intermedia del documento en bytes. El writer sí mantiene en memoria los
+    objetos de todas las páginas (incluidos los anexos) hasta este write().
+
+    Se escribe en un temporal y se renombra para que nunca se sirva un archivo a medias.
+    """
+    with archivos.escritura_atomica(_ruta(clave), preparar=linealizar) as f:
+        documento.write(f)
+    # Los más antiguos son versiones de datos ya superadas
+    archivos.podar(settings.CV_PDF_CACHE_DIR, settings.CV_PDF_CACHE_MAX_ARCHIVOS, '.pdf')
+    return _ruta(clave)
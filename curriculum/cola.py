@@ -0,0 +1,201 @@
+"""
+Generación del PDF del CV en segundo plano, usando la base de datos como cola.
+
+configurar_cv envía las banderas (encolar), recibe el id del trabajo y consulta
+su estado hasta que el PDF está listo. Los trabajos los procesa un hilo del
+propio proceso web (CV_TRABAJOS_HILO) y/o el comando `procesar_trabajos_cv`
+en un proceso aparte; varios workers pueden convivir porque cada trabajo se
+reclama con un UPDATE condicionado al estado.
+
+Dos envíos con la misma huella (banderas + versión de los datos) comparten un
+único trabajo: la tabla tiene una restricción única sobre los trabajos activos.
+"""
+import os
+import datetime
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import admision, archivos, cache_pdf, cv, generador
+from .metricas import Cronometro
+from .models import TrabajoPDF
+
+logger = logging.getLogger(__name__)
+
+Estado = TrabajoPDF.Estado
+ACTIVOS = (Estado.PENDIENTE, Estado.EN_PROCESO)
+
+_hilo = None
+_lock = threading.Lock()
+_aviso = threading.Event()
+
+
+def disponible(trabajo):
+    """El trabajo terminó y su PDF sigue en disco (la caché de PDFs se poda)."""
+    return trabajo.estado == Estado.LISTO and os.path.isfile(trabajo.ruta)
+
+
+def encolar(banderas, base_url):
+    """Devuelve el trabajo que genera este documento, reutilizando uno en curso o ya terminado."""
+    clave = cache_pdf.clave_cv(banderas, base_url)
+    trabajo = TrabajoPDF.objects.filter(clave=clave).exclude(estado=Estado.ERROR).order_by('-fecha_creacion').first()
+    if trabajo and (trabajo.estado in ACTIVOS or disponible(trabajo)):
+        return trabajo
+
+    ruta = cache_pdf.obtener(clave)
+    if ruta:
+        # Ya lo generó una descarga directa: el trabajo nace terminado
+        ahora = timezone.now()
+        return TrabajoPDF.objects.create(
+            clave=clave, banderas=banderas, base_url=base_url,
+            estado=Estado.LISTO, ruta=ruta, fecha_inicio=ahora, fecha_fin=ahora,
+        )
+
+    try:
+        with transaction.atomic():
+            trabajo = TrabajoPDF.objects.create(clave=clave, banderas=banderas, base_url=base_url)
+    except IntegrityError:
+        # Otra petición idéntica creó el trabajo entre la consulta y el INSERT
+        return TrabajoPDF.objects.filter(clave=clave).order_by('-fecha_creacion').first()
+    transaction.on_commit(despertar)
+    return trabajo
+
+
+def _rescatar():
+    """
+    Devuelve a la cola los trabajos de un worker que murió a mitad: los que
+    llevan CV_TRABAJOS_MAX_SEGUNDOS sin latido. Un trabajo que sigue esperando
+    turno o generándose renueva su latido y no se toca, por mucho que tarde.
+    """
+    limite = timezone.now() - datetime.timedelta(seconds=settings.CV_TRABAJOS_MAX_SEGUNDOS)
+    TrabajoPDF.objects.filter(
+        Q(latido__lt=limite) | Q(latido__isnull=True, fecha_inicio__lt=limite),
+        estado=Estado.EN_PROCESO,
+    ).update(estado=Estado.PENDIENTE, fecha_inicio=None, latido=None)
+
+
+def reclamar():
+    """Toma el trabajo pendiente más antiguo, o None si la cola está vacía."""
+    _rescatar()
+    pendientes = TrabajoPDF.objects.filter(estado=Estado.PENDIENTE).values_list('id', flat=True)
+    for id_trabajo in pendientes[:10]:
+        # Solo un worker consigue cambiar el estado; los demás prueban con el siguiente
+        ahora = timezone.now()
+        tomado = TrabajoPDF.objects.filter(id=id_trabajo, estado=Estado.PENDIENTE).update(
+            estado=Estado.EN_PROCESO, fecha_inicio=ahora, latido=ahora,
+        )
+        if tomado:
+            return TrabajoPDF.objects.get(id=id_trabajo)
+    return None
+
+
+@contextmanager
+def _latiendo(trabajo):
+    """Renueva el latido del trabajo en un hilo mientras dura el bloque."""
+    parar = threading.Event()
+
+    def latir():
+        try:
+            while not parar.wait(settings.CV_TRABAJOS_LATIDO):
+                TrabajoPDF.objects.filter(id=trabajo.id, estado=Estado.EN_PROCESO).update(latido=timezone.now())
+        finally:
+            connection.close()
+
+    hilo = threading.Thread(target=latir, daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        hilo.join()
+
+
+def _guardar_incompleto(trabajo, documento):
+    """Los documentos con anexos fallidos no van a la caché; se guardan aparte para este trabajo."""
+    ruta = os.path.join(settings.CV_TRABAJOS_DIR, f"{trabajo.id}.pdf")
+    with archivos.escritura_atomica(ruta) as f:
+        documento.write(f)
+    return ruta
+
+
+def procesar(trabajo):
+    cronometro = Cronometro()
+    cronometro.datos['trabajo'] = trabajo.id
+    try:
+        ruta = cache_pdf.obtener(trabajo.clave)
+        if not ruta:
+            # Normalizadas por si el trabajo se encoló con otra versión de las banderas
+            banderas = {nombre: bool(trabajo.banderas.get(nombre)) for nombre in cv.BANDERAS_CV}
+            # Comparte los huecos de generación con las descargas directas; el
+            # latido evita que otro worker lo dé por abandonado mientras espera
+            with _latiendo(trabajo), admision.turno(cronometro, con_cola=False):
+                merger, errores = generador.generar(banderas, trabajo.base_url, cronometro)
+                with cronometro.etapa('escritura'):
+                    if not errores:
+                        ruta = cache_pdf.guardar(trabajo.clave, merger)
+                    else:
+                        ruta = _guardar_incompleto(trabajo, merger)
+        trabajo.estado, trabajo.ruta = Estado.LISTO, ruta
+    except Exception as e:
+        logger.exception("Error en el trabajo PDF %s", trabajo.id)
+        trabajo.estado, trabajo.error = Estado.ERROR, str(e)
+        cronometro.datos['error'] = type(e).__name__
+    trabajo.fecha_fin = timezone.now()
+    trabajo.save(update_fields=['estado', 'ruta', 'error', 'fecha_fin'])
+    cronometro.datos['estado'] = trabajo.get_estado_display()
+    cronometro.registrar('cv_pdf_trabajo')
+    return trabajo
+
+
+def procesar_pendientes():
+    """Procesa trabajos hasta vaciar la cola y devuelve cuántos se procesaron."""
+    procesados = 0
+    while True:
+        trabajo = reclamar()
+        if trabajo is None:
+            return procesados
+        procesar(trabajo)
+        procesados += 1
+
+
+def limpiar():
+    """Borra los trabajos terminados hace más de CV_TRABAJOS_CONSERVAR_HORAS y sus PDFs incompletos."""
+    limite = timezone.now() - datetime.timedelta(hours=settings.CV_TRABAJOS_CONSERVAR_HORAS)
+    viejos = TrabajoPDF.objects.exclude(estado__in=ACTIVOS).filter(fecha_creacion__lt=limite)
+    for ruta in viejos.values_list('ruta', flat=True):
+        # Los PDFs de la caché se podan por su cuenta; solo se borran los propios
+        if ruta and os.path.dirname(ruta) == settings.CV_TRABAJOS_DIR:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+    viejos.delete()
+
+
+def _bucle():
+    while True:
+        _aviso.clear()
+        try:
+            procesar_pendientes()
+            limpiar()
+        except Exception:
+            logger.exception("Error procesando la cola de PDFs")
+        finally:
+            connection.close()
+        # Se despierta al encolar; la espera acotada recoge los trabajos de otros procesos
+        _aviso.wait(timeout=30)
+
+
+def despertar():
+    """Avisa al hilo de este proceso (arrancándolo si hace falta) de que hay trabajos nuevos."""
+    global _hilo
+    if not settings.CV_TRABAJOS_HILO:
+        return
+    with _lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_bucle, name='trabajos-pdf', daemon=True)
+            _hilo.start()
+    _aviso.set()
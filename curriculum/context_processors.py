@@ -1,3 +1,3 @@
-from .models import ConfiguracionPagina
+from . import instantanea
 def visibilidad_context(request): 
-    return {'config': ConfiguracionPagina.objects.first()}
\ No newline at end of file
+    return {'config': instantanea.visibilidad()}
@@ -0,0 +1,190 @@
+"""
+Etapas de la generación del PDF del CV.
+
+generador.generar las encadena y el comando benchmark_cv las mide por separado:
+consultas -> HTML -> PDF principal -> lectura de anexos -> fusión.
+"""
+import io
+import hashlib
+import logging
+from pypdf import PdfWriter
+from django.conf import settings
+from django.template.loader import get_template
+from . import anexos, instantanea, versiones
+from .render import renderizar_pdf, ErrorRender
+from .models import (
+    DatosPersonales, Idioma, ExperienciaLaboral, EstudioRealizado,
+    CursoCapacitacion, Reconocimiento, ProductoAcademico, VentaGarage
+)
+
+logger = logging.getLogger(__name__)
+
+# Banderas del formulario de configurar_cv.html (checkbox marcado = 'on')
+BANDERAS_CV = (
+    'ocultar_foto', 'ocultar_contacto', 'ocultar_perfil', 'ocultar_intereses',
+    'ocultar_experiencia', 'ocultar_educacion', 'ocultar_cursos', 'ocultar_idiomas',
+    'ocultar_redes', 'ocultar_valores', 'ocultar_proyectos', 'ocultar_reconocimientos',
+    'ocultar_venta', 'ocultar_anexos',
+)
+
+# Secciones con anexos, en el orden en que se fusionan:
+# (sección, bandera que la oculta, clave en consultar_datos, modelo, campo del archivo)
+SECCIONES_ANEXOS = (
+    ('experiencia', 'ocultar_experiencia', 'experiencias', ExperienciaLaboral, 'certificado_pdf'),
+    ('educacion', 'ocultar_educacion', 'estudios', EstudioRealizado, 'certificado_pdf'),
+    ('proyectos', 'ocultar_proyectos', 'proyectos', ProductoAcademico, 'archivo'),
+    ('cursos', 'ocultar_cursos', 'cursos', CursoCapacitacion, 'certificado_pdf'),
+)
+
+
+def leer_banderas(parametros):
+    return {nombre: parametros.get(nombre) == 'on' for nombre in BANDERAS_CV}
+
+
+def consultar_datos():
+    """
+    Ejecuta todas las consultas del CV de una vez (las listas ya no vuelven a la base de datos).
+
+    Las versiones de los fragmentos se leen antes que los datos, como en
+    instantanea.py: si un cambio se confirma entre medias, los fragmentos de
+    esta generación se guardan con la versión anterior, que ya nadie pide.
+    """
+    return {
+        'versiones': versiones.tokens(*MODELOS_FRAGMENTOS.values()),
+        'perfil': instantanea.perfil(),
+        'experiencias': list(ExperienciaLaboral.objects.filter(activo=True)),
+        'estudios': list(EstudioRealizado.objects.filter(activo=True)),
+        'cursos': list(CursoCapacitacion.objects.filter(activo=True)),
+        'reconocimientos': list(Reconocimiento.objects.filter(activo=True)),
+        'proyectos': list(ProductoAcademico.objects.filter(activo=True)),
+        'productos': list(VentaGarage.objects.filter(activo=True)),
+    }
+
+
+# Modelo del que depende cada fragmento cacheado de cv_pdf.html ({% cache %})
+MODELOS_FRAGMENTOS = {
+    'perfil': DatosPersonales,
+    'idioma': Idioma,
+    'experiencia': ExperienciaLaboral,
+    'educacion': EstudioRealizado,
+    'proyectos': ProductoAcademico,
+    'cursos': CursoCapacitacion,
+    'reconocimientos': Reconocimiento,
+    'venta': VentaGarage,
+}
+
+def _plantilla(nombre):
+    """Plantilla y huella de su código, para que un cambio en ella no reutilice fragmentos viejos."""
+    plantilla = get_template(nombre)
+    return plantilla, hashlib.sha256(plantilla.template.source.encode()).hexdigest()[:16]
+
+
+def renderizar_html(datos, banderas, base_url):
+    """
+    Cada sección de cv_pdf.html se guarda ya renderizada en la caché, con la
+    versión de su modelo en la clave: las banderas solo deciden qué fragmentos
+    se concatenan y solo se vuelve a renderizar la sección cuyos datos cambiaron.
+    """
+    plantilla, huella = _plantilla('curriculum/cv_pdf.html')
+    fragmentos = {
+        seccion: datos['versiones'][modelo] for seccion, modelo in MODELOS_FRAGMENTOS.items()
+    }
+    fragmentos['plantilla'] = huella
+    fragmentos['timeout'] = settings.CV_FRAGMENTOS_TIMEOUT
+    context = {
+        **datos,
+        'MEDIA_URL': settings.MEDIA_URL,
+        'base_url': base_url,
+        'fragmentos': fragmentos,
+        **banderas,
+    }
+    return plantilla.render(context)
+
+
+def _es_fusionable(campo, metadatos):
+    return bool(campo) and (campo.name not in metadatos or metadatos[campo.name].fusionable)
+
+
+def filtrar_fusionables(campos):
+    """
+    Descarta los archivos vacíos y los que ya se analizaron al subirse y no se
+    pueden fusionar (ZIP, cifrados, corruptos), sin descargarlos.
+    """
+    metadatos = anexos.metadatos_de(campos)
+    return [campo for campo in campos if _es_fusionable(campo, metadatos)]
+
+
+def secciones_anexos(datos, banderas):
+    """Archivos a anexar agrupados por sección, en el orden de fusión: [(seccion, campos), ...]."""
+    if banderas['ocultar_anexos']:
+        return []
+    secciones = [
+        (seccion, [getattr(obj, campo) for obj in datos[clave]])
+        for seccion, bandera, clave, _modelo, campo in SECCIONES_ANEXOS
+        if not banderas[bandera]
+    ]
+    # Una sola consulta de metadatos para todas las secciones
+    metadatos = anexos.metadatos_de([c for _, campos in secciones for c in campos])
+    return [
+        (seccion, [campo for campo in campos if _es_fusionable(campo, metadatos)])
+        for seccion, campos in secciones
+    ]
+
+
+def campos_anexos(datos, banderas):
+    """Archivos a anexar, en el orden de las secciones."""
+    return [campo for _, campos in secciones_anexos(datos, banderas) for campo in campos]
+
+
+def pagina_enlace(anexo, base_url):
+    """PDF de una página con el enlace al anexo, en el mismo formato que los enlaces del CV."""
+    url = anexo.url if anexo.url.startswith('http') else f"{base_url}{anexo.url}"
+    html = get_template('curriculum/anexo_enlace.html').render({
+        'nombre': anexo.nombre.rsplit('/', 1)[-1],
+        'url': url,
+    })
+    return renderizar_pdf(html)
+
+
+def _sustituir(merger, anexo, base_url):
+    """Anexa la página de enlace en el lugar del anexo que no se pudo incluir."""
+    if not anexo.url:
+        return
+    try:
+        merger.append(io.BytesIO(pagina_enlace(anexo, base_url)))
+    except ErrorRender:
+        logger.exception("No se pudo generar el enlace al anexo %s", anexo.nombre)
+
+
+def fusionar(cv_pdf, leidos, base_url=''):
+    """
+    Une el PDF principal con los anexos leídos.
+
+    Devuelve el PdfWriter y la lista de anexos que fallaron (red, storage,
+    tiempo agotado), que se sustituyen por una página con su enlace; el
+    documento queda degradado y no debe guardarse en caché.
+
+    El PdfWriter copia los objetos de las páginas de cada anexo, así que la
+    memoria hasta escribirlo crece con el tamaño total de los anexos; lo que
+    se evita es guardar además los bytes originales de cada uno.
+    """
+    merger = PdfWriter()
+    merger.append(io.BytesIO(cv_pdf))
+
+    errores = []
+    for anexo in leidos:
+        if anexo.error:
+            logger.warning("Error adjuntando archivo %s: %s", anexo.nombre, anexo.error)
+            errores.append(anexo.nombre)
+            _sustituir(merger, anexo, base_url)
+        elif anexo.es_pdf:
+            try:
+                with anexo.abrir() as flujo:
+                    merger.append(flujo)
+            except Exception:
+                logger.exception("Error adjuntando archivo %s", anexo.nombre)
+                errores.append(anexo.nombre)
+                _sustituir(merger, anexo, base_url)
+        # El writer ya copió las páginas; se suelta el original para no duplicar memoria
+        anexo.contenido = None
+    return merger, errores
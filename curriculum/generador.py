@@ -0,0 +1,46 @@
+"""
+Generación completa del PDF del CV, compartida por la descarga directa
+(views.generar_cv) y por los trabajos en segundo plano (cola.py).
+"""
+from django.conf import settings
+from . import cv, paquetes
+from .metricas import Cronometro
+from .optimizar import optimizar
+from .render import renderizar_pdf
+
+
+def generar(banderas, base_url, cronometro=None, limite=None):
+    """
+    Ejecuta todas las etapas y devuelve (merger, errores) listo para escribir.
+
+    `limite` (instante de time.monotonic) acota la descarga de anexos, dejando
+    CV_PDF_RESERVA segundos para fusionar y escribir; los anexos que no llegan
+    a tiempo se sustituyen por una página con su enlace y cuentan como errores.
+    Sin `limite` (trabajos en segundo plano) se espera a todos los anexos.
+    Lanza render.ErrorRender si no se pudo generar el PDF principal.
+    """
+    cronometro = cronometro or Cronometro()
+
+    with cronometro.etapa('db'):
+        datos = cv.consultar_datos()
+    with cronometro.etapa('html'):
+        html = cv.renderizar_html(datos, banderas, base_url)
+    with cronometro.etapa('pdf'):
+        cv_pdf = renderizar_pdf(html)
+
+    # LÓGICA DE FUSIÓN (ANEXOS): paquetes por sección ya fusionados o, si aún no
+    # existen, cada anexo leído en paralelo; siempre en el orden de las secciones
+    with cronometro.etapa('anexos'):
+        leidos = paquetes.leer_secciones(
+            cv.secciones_anexos(datos, banderas),
+            None if limite is None else limite - settings.CV_PDF_RESERVA,
+        )
+    cronometro.datos['anexos'] = len(leidos)
+    cronometro.datos['bytes_anexos'] = sum(anexo.tamano for anexo in leidos)
+
+    with cronometro.etapa('fusion'):
+        merger, errores = cv.fusionar(cv_pdf, leidos, base_url)
+        optimizar(merger)
+    cronometro.datos['paginas'] = len(merger.pages)
+    cronometro.datos['errores_anexos'] = len(errores)
+    return merger, errores
@@ -0,0 +1,113 @@
+import os
+import hashlib
+import logging
+from urllib.parse import urlparse
+from PIL import Image, ImageOps
+from django.conf import settings
+from . import archivos
+from .anexos import sesion
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+
+
+def es_imagen(uri):
+    return os.path.splitext(urlparse(uri).path)[1].lower() in EXTENSIONES
+
+
+def _existente(base):
+    for extension in ('.jpg', '.png'):
+        try:
+            # Se actualiza la fecha para que la poda descarte primero los menos usados
+            os.utime(base + extension)
+            return base + extension
+        except OSError:
+            pass
+    return None
+
+
+def _generar(origen, base):
+    """
+    Reduce la imagen al tamaño de impresión (CV_PDF_IMAGEN_MAX) y la guarda junto a `base`.
+
+    Se guarda en JPEG salvo que tenga transparencia, que se conserva en PNG.
+    """
+    with Image.open(origen) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        imagen.thumbnail(settings.CV_PDF_IMAGEN_MAX, Image.LANCZOS)
+        con_alfa = imagen.mode in ('RGBA', 'LA') or 'transparency' in imagen.info
+        if con_alfa:
+            imagen, extension, opciones = imagen.convert('RGBA'), '.png', {'optimize': True}
+        else:
+            imagen, extension, opciones = imagen.convert('RGB'), '.jpg', {'quality': 85, 'optimize': True}
+
+        with archivos.escritura_atomica(base + extension) as f:
+            imagen.save(f, 'PNG' if con_alfa else 'JPEG', **opciones)
+    archivos.podar(settings.CV_PDF_DERIVADOS_DIR, settings.CV_PDF_DERIVADOS_MAX_ARCHIVOS)
+    return base + extension
+
+
+def _base(clave):
+    tamano = 'x'.join(str(n) for n in settings.CV_PDF_IMAGEN_MAX)
+    nombre = hashlib.sha256(f"{clave}|{tamano}".encode()).hexdigest()
+    return os.path.join(settings.CV_PDF_DERIVADOS_DIR, nombre)
+
+
+def derivado_local(path):
+    """Ruta de la versión reducida de una imagen en disco; se regenera si el original cambia."""
+    try:
+        estado = os.stat(path)
+        base = _base(f"{path}|{estado.st_mtime_ns}|{estado.st_size}")
+        return _existente(base) or _generar(path, base)
+    except Exception:
+        logger.exception("No se pudo reducir la imagen %s", path)
+        return None
+
+
+def derivado_remoto(url):
+    """Igual que derivado_local para imágenes en Cloudinary (la URL ya cambia con cada versión)."""
+    ruta = recurso_remoto(url)
+    return derivado_local(ruta) if ruta else None
+
+
+def preparar(campo_imagen):
+    """Genera por adelantado el derivado de una imagen recién subida."""
+    if not campo_imagen:
+        return None
+    try:
+        return derivado_local(campo_imagen.path)
+    except NotImplementedError:
+        # Storage remoto (Cloudinary): no hay ruta local
+        return derivado_remoto(campo_imagen.url)
+
+
+def recurso_remoto(url):
+    """
+    Copia local de un recurso remoto que pide xhtml2pdf (imágenes, hojas de
+    estilo, fuentes), descargada una sola vez y por bloques, hasta
+    CV_RECURSOS_MAX_MB.
+
+    La fecha de la copia no se actualiza al usarla (su derivado depende de
+    ella), así que la poda descarta primero las descargadas hace más tiempo.
+    """
+    extension = os.path.splitext(urlparse(url).path)[1].lower()[:10]
+    ruta = os.path.join(settings.CV_RECURSOS_DIR, hashlib.sha256(url.encode()).hexdigest() + extension)
+    if os.path.isfile(ruta):
+        return ruta
+    maximo = settings.CV_RECURSOS_MAX_MB * 1024 * 1024
+    try:
+        with sesion().get(url, timeout=settings.CV_ANEXOS_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            with archivos.escritura_atomica(ruta) as f:
+                total = 0
+                for bloque in response.iter_content(chunk_size=64 * 1024):
+                    total += len(bloque)
+                    if total > maximo:
+                        raise ValueError(f"Supera el tamaño máximo de {settings.CV_RECURSOS_MAX_MB} MB")
+                    f.write(bloque)
+        archivos.podar(settings.CV_RECURSOS_DIR, settings.CV_RECURSOS_MAX_ARCHIVOS)
+        return ruta
+    except Exception:
+        logger.exception("No se pudo descargar el recurso %s", url)
+        return None
@@ -0,0 +1,81 @@
+"""
+Instantánea por proceso del perfil (con sus idiomas) y de la configuración de visibilidad.
+
+Son filas únicas que cambian muy de vez en cuando pero que pide cada página.
+Cada worker guarda su copia junto con la versión con la que se leyó; la
+versión vive en la caché compartida (versiones.py) y la renuevan las señales
+post_save/post_delete, así que un cambio en el admin llega a todos los
+workers en la siguiente petición. Mientras tanto, una página no consulta la
+base de datos para estos datos.
+
+La versión se lee una sola vez por petición (la pide el context processor,
+la vista y la plantilla) y se recuerda hasta que termina; fuera de una
+petición (trabajos, comandos) se lee en cada llamada.
+
+Los objetos se comparten entre peticiones: son de solo lectura.
+"""
+import threading
+from asgiref.local import Local
+from django.core.signals import request_started, request_finished
+from . import versiones
+from .models import DatosPersonales, Idioma, ConfiguracionPagina
+
+MODELOS = (DatosPersonales, Idioma, ConfiguracionPagina)
+
+_actual = None
+_lock = threading.Lock()
+# Versión ya leída en la petición en curso (por hilo / tarea asíncrona)
+_peticion = Local()
+
+
+class Instantanea:
+    def __init__(self, version):
+        self.version = version
+        self.perfil = DatosPersonales.objects.prefetch_related('idiomas').first()
+        self.visibilidad = ConfiguracionPagina.objects.first()
+
+
+def _empezar_peticion(**kwargs):
+    _peticion.en_curso = True
+    _peticion.version = None
+
+
+def _terminar_peticion(**kwargs):
+    _peticion.en_curso = False
+    _peticion.version = None
+
+
+def conectar():
+    request_started.connect(_empezar_peticion, dispatch_uid='instantanea-peticion-inicio')
+    request_finished.connect(_terminar_peticion, dispatch_uid='instantanea-peticion-fin')
+
+
+def _version():
+    version = getattr(_peticion, 'version', None)
+    if version is None:
+        version = versiones.version_datos(*MODELOS)
+        if getattr(_peticion, 'en_curso', False):
+            _peticion.version = version
+    return version
+
+
+def actual():
+    global _actual
+    # La versión se lee antes que los datos: si cambian mientras se cargan,
+    # la próxima petición verá otra versión y volverá a cargarlos
+    version = _version()
+    instantanea = _actual
+    if instantanea is None or instantanea.version != version:
+        with _lock:
+            if _actual is None or _actual.version != version:
+                _actual = Instantanea(version)
+            instantanea = _actual
+    return instantanea
+
+
+def perfil():
+    return actual().perfil
+
+
+def visibilidad():
+    return actual().visibilidad
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from curriculum import anexos
+from curriculum.models import MetadatosArchivo
+from curriculum.signals import CAMPOS_ANEXO
+
+
+class Command(BaseCommand):
+    help = "Analiza los archivos anexos ya subidos que todavía no tienen metadatos (o todos con --todos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true', help="Vuelve a analizar también los ya registrados.")
+
+    def handle(self, *args, **options):
+        analizados = 0
+        for modelo, campo in CAMPOS_ANEXO.items():
+            for obj in modelo.objects.exclude(**{campo: ''}).exclude(**{f"{campo}__isnull": True}):
+                archivo = getattr(obj, campo)
+                if not options['todos'] and MetadatosArchivo.objects.filter(nombre=archivo.name).exists():
+                    continue
+                metadatos = anexos.analizar(archivo)
+                if metadatos:
+                    analizados += 1
+                    estado = 'fusionable' if metadatos.fusionable else 'se omitirá'
+                    self.stdout.write(f"{archivo.name}: {metadatos.paginas} páginas ({estado})")
+        self.stdout.write(self.style.SUCCESS(f"{analizados} archivos analizados."))
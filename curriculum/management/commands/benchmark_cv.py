@@ -0,0 +1,227 @@
+import io
+import json
+import time
+import random
+import datetime
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, NameObject
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from curriculum import anexos, cv
+from curriculum.optimizar import optimizar
+from curriculum.render import renderizar_pdf
+from curriculum.models import (
+    DatosPersonales, Idioma, ExperienciaLaboral, EstudioRealizado,
+    CursoCapacitacion, Reconocimiento, ProductoAcademico, VentaGarage
+)
+
+ETAPAS = ('consultas', 'html', 'pdf', 'anexos', 'fusion')
+
+
+def pdf_sintetico(kb, paginas=1):
+    """PDF válido de aproximadamente `kb` KB (relleno con comentarios en el content stream)."""
+    documento = PdfWriter()
+    relleno = max(kb * 1024 // paginas, 64)
+    for _ in range(paginas):
+        pagina = documento.add_blank_page(595, 842)
+        contenido = DecodedStreamObject()
+        lineas = []
+        while sum(len(linea) for linea in lineas) < relleno:
+            lineas.append(b'% ' + random.randbytes(48).hex().encode() + b'\n')
+        contenido.set_data(b''.join(lineas) + b'BT /F1 12 Tf 72 770 Td (Anexo) Tj ET\n')
+        pagina[NameObject('/Contents')] = documento._add_object(contenido)
+    buffer = io.BytesIO()
+    documento.write(buffer)
+    return buffer.getvalue()
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide cada etapa de la generación del PDF del CV sobre datos sintéticos "
+        "(base de datos y media temporales) y escribe los resultados en JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--experiencias', type=int, default=10)
+        parser.add_argument('--estudios', type=int, default=3)
+        parser.add_argument('--cursos', type=int, default=10)
+        parser.add_argument('--proyectos', type=int, default=5)
+        parser.add_argument('--anexo-kb', type=int, default=200, help="Tamaño de cada PDF anexo en KB.")
+        parser.add_argument('--anexo-paginas', type=int, default=1)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=1, help="Semilla para que los datos sean reproducibles.")
+        parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto, la salida estándar).")
+
+    def handle(self, *args, **options):
+        random.seed(options['semilla'])
+        nombre_original = settings.DATABASES['default']['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media, override_settings(
+                MEDIA_ROOT=media,
+                MEDIA_URL='/media/',
+                STORAGES={
+                    **settings.STORAGES,
+                    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                },
+                # Caché propia: las señales de sembrar() no invalidan la caché real del
+                # servidor y cada pasada empieza sin fragmentos ya renderizados
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                CV_RENDER_PROCESOS=0,
+                # Se mide la fusión anexo por anexo, sin paquetes pre-fusionados
+                CV_PAQUETES_ANEXOS=False,
+            ):
+                self.sembrar(options)
+                resultados = self.medir(options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        salida = json.dumps(resultados, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w') as f:
+                f.write(salida + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Resultados en {options['salida']}"))
+        else:
+            self.stdout.write(salida)
+
+    def sembrar(self, options):
+        hoy = datetime.date(2024, 1, 1)
+
+        perfil = DatosPersonales.objects.create(
+            cedula='0000000000', nombres='Perfil', apellidos='Sintético', sexo='Otro',
+            estado_civil='Soltera/o', telefono='0990000000', email='perfil@example.com',
+            direccion='Dirección de prueba', descripcion_perfil='Resumen profesional. ' * 20,
+            intereses='Lectura, música', valores_profesionales='Responsabilidad, Constancia',
+        )
+        Idioma.objects.create(nombre='Español', nivel='Nativo', perfil=perfil)
+        Idioma.objects.create(nombre='Inglés', nivel='B2', perfil=perfil)
+
+        def con_anexo(obj, campo, nombre):
+            # Cada anexo es distinto, como en un CV real (la deduplicación no debe falsear el resultado)
+            anexo = pdf_sintetico(options['anexo_kb'], options['anexo_paginas'])
+            getattr(obj, campo).save(nombre, ContentFile(anexo), save=False)
+            obj.save()
+
+        for i in range(options['experiencias']):
+            con_anexo(ExperienciaLaboral(
+                cargo=f'Cargo {i}', empresa=f'Empresa {i}',
+                fecha_inicio=hoy - datetime.timedelta(days=30 * (i + 1)),
+                descripcion='Actividades realizadas. ' * random.randint(5, 20),
+            ), 'certificado_pdf', f'exp_{i}.pdf')
+        for i in range(options['estudios']):
+            con_anexo(EstudioRealizado(
+                titulo=f'Título {i}', institucion=f'Universidad {i}',
+                fecha_inicio=hoy - datetime.timedelta(days=365 * (i + 4)),
+                fecha_fin=hoy - datetime.timedelta(days=365 * i),
+            ), 'certificado_pdf', f'estudio_{i}.pdf')
+        for i in range(options['cursos']):
+            con_anexo(CursoCapacitacion(
+                nombre_curso=f'Curso {i}', institucion=f'Instituto {i}',
+                fecha_realizacion=hoy - datetime.timedelta(days=20 * i), horas=random.randint(4, 120),
+            ), 'certificado_pdf', f'curso_{i}.pdf')
+        for i in range(options['proyectos']):
+            con_anexo(ProductoAcademico(
+                nombre=f'Proyecto {i}', descripcion='Descripción del proyecto. ' * 5,
+                fecha_publicacion=hoy - datetime.timedelta(days=60 * i),
+            ), 'archivo', f'proyecto_{i}.pdf')
+        for i in range(5):
+            Reconocimiento.objects.create(nombre=f'Premio {i}', institucion='Institución')
+            VentaGarage.objects.create(nombre_producto=f'Artículo {i}', precio=10, estado='Bueno', fecha_publicacion=hoy)
+
+    def ejecutar(self, tiempos=None, memoria=None):
+        """Una pasada completa del pipeline, acumulando la duración (y el pico de memoria) de cada etapa."""
+        banderas = cv.leer_banderas({})
+        estado = {}
+        # Sin fragmentos ni instantánea de la pasada anterior: se mide el render completo
+        cache.clear()
+
+        def etapa(nombre, funcion):
+            if memoria is not None:
+                tracemalloc.reset_peak()
+            inicio = time.perf_counter()
+            resultado = funcion()
+            if tiempos is not None:
+                tiempos[nombre].append((time.perf_counter() - inicio) * 1000)
+            if memoria is not None:
+                memoria[nombre] = tracemalloc.get_traced_memory()[1] // 1024
+            return resultado
+
+        datos = etapa('consultas', cv.consultar_datos)
+        html = etapa('html', lambda: cv.renderizar_html(datos, banderas, 'http://benchmark'))
+        cv_pdf = etapa('pdf', lambda: renderizar_pdf(html))
+        leidos = etapa('anexos', lambda: anexos.leer_anexos(cv.campos_anexos(datos, banderas)))
+
+        def fusion():
+            merger, _ = cv.fusionar(cv_pdf, leidos, 'http://benchmark')
+            optimizar(merger)
+            buffer = io.BytesIO()
+            merger.write(buffer)
+            estado['paginas'] = len(merger.pages)
+            estado['bytes'] = buffer.tell()
+        etapa('fusion', fusion)
+        return estado
+
+    def medir(self, options):
+        # Pasada de calentamiento: carga de plantillas, fuentes de reportlab, etc.
+        self.ejecutar()
+
+        tiempos = {nombre: [] for nombre in ETAPAS}
+        for _ in range(options['repeticiones']):
+            estado = self.ejecutar(tiempos)
+
+        # El pico de memoria se mide en una pasada aparte para no distorsionar los tiempos
+        memoria = {}
+        tracemalloc.start()
+        self.ejecutar(memoria=memoria)
+        tracemalloc.stop()
+
+        totales = [sum(tiempos[nombre][i] for nombre in ETAPAS) for i in range(options['repeticiones'])]
+        etapas = {
+            nombre: {
+                'p50_ms': round(percentil(tiempos[nombre], 50), 2),
+                'p95_ms': round(percentil(tiempos[nombre], 95), 2),
+                'pico_memoria_kb': memoria[nombre],
+            }
+            for nombre in ETAPAS
+        }
+        etapas['total'] = {
+            'p50_ms': round(percentil(totales, 50), 2),
+            'p95_ms': round(percentil(totales, 95), 2),
+        }
+
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {
+            'commit': commit,
+            'parametros': {
+                clave: options[clave] for clave in (
+                    'experiencias', 'estudios', 'cursos', 'proyectos',
+                    'anexo_kb', 'anexo_paginas', 'repeticiones', 'semilla',
+                )
+            },
+            'etapas': etapas,
+            'paginas': estado['paginas'],
+            'tamano_pdf_bytes': estado['bytes'],
+            # ru_maxrss está en KB en Linux
+            'pico_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
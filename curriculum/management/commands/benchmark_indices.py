@@ -0,0 +1,137 @@
+import json
+import time
+import random
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from curriculum.models import (
+    ExperienciaLaboral, EstudioRealizado, CursoCapacitacion,
+    Reconocimiento, ProductoAcademico, VentaGarage
+)
+from .benchmark_cv import percentil
+
+MODELOS = (
+    ExperienciaLaboral, EstudioRealizado, ProductoAcademico,
+    CursoCapacitacion, Reconocimiento, VentaGarage,
+)
+TAMANO_PAGINA = 50
+
+
+def fila(modelo, i, fecha, activo):
+    """Fila sintética con los campos obligatorios de cada modelo."""
+    if modelo is ExperienciaLaboral:
+        return ExperienciaLaboral(cargo=f'Cargo {i}', empresa='Empresa', fecha_inicio=fecha, activo=activo)
+    if modelo is EstudioRealizado:
+        return EstudioRealizado(
+            titulo=f'Título {i}', institucion='Universidad', fecha_inicio=fecha, fecha_fin=fecha, activo=activo,
+        )
+    if modelo is ProductoAcademico:
+        return ProductoAcademico(nombre=f'Proyecto {i}', fecha_publicacion=fecha, activo=activo)
+    if modelo is CursoCapacitacion:
+        return CursoCapacitacion(
+            nombre_curso=f'Curso {i}', institucion='Instituto', fecha_realizacion=fecha, horas=10, activo=activo,
+        )
+    if modelo is Reconocimiento:
+        return Reconocimiento(nombre=f'Premio {i}', institucion='Institución', fecha_obtencion=fecha, activo=activo)
+    return VentaGarage(
+        nombre_producto=f'Artículo {i}', precio=10, estado='Bueno', fecha_publicacion=fecha, activo=activo,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide las consultas de las listas públicas (activo=True ordenadas por fecha) "
+        "con y sin los índices parciales, sobre una base de datos temporal del mismo "
+        "motor que DATABASES (SQLite o PostgreSQL). Escribe planes y latencias en JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=100_000, help="Filas por modelo.")
+        parser.add_argument('--inactivas', type=float, default=0.1, help="Proporción de filas con activo=False.")
+        parser.add_argument('--repeticiones', type=int, default=10)
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto, la salida estándar).")
+
+    def handle(self, *args, **options):
+        random.seed(options['semilla'])
+        nombre_original = settings.DATABASES['default']['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.sembrar(options)
+            resultados = {
+                'motor': connection.vendor,
+                'filas': options['filas'],
+                'con_indices': self.medir(options),
+            }
+            self.quitar_indices()
+            resultados['sin_indices'] = self.medir(options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        salida = json.dumps(resultados, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w') as f:
+                f.write(salida + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Resultados en {options['salida']}"))
+        else:
+            self.stdout.write(salida)
+
+    def sembrar(self, options):
+        hoy = datetime.date(2024, 1, 1)
+        for modelo in MODELOS:
+            filas = (
+                fila(
+                    modelo, i,
+                    hoy - datetime.timedelta(days=random.randint(0, 20 * 365)),
+                    random.random() >= options['inactivas'],
+                )
+                for i in range(options['filas'])
+            )
+            modelo.objects.bulk_create(filas, batch_size=5000)
+        self.actualizar_estadisticas()
+
+    def actualizar_estadisticas(self):
+        # Estadísticas del planificador (y, en PostgreSQL, el mapa de visibilidad
+        # que permite los Index Only Scan)
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM ANALYZE' if connection.vendor == 'postgresql' else 'ANALYZE')
+
+    def quitar_indices(self):
+        with connection.schema_editor() as editor:
+            for modelo in MODELOS:
+                for indice in modelo._meta.indexes:
+                    editor.remove_index(modelo, indice)
+        self.actualizar_estadisticas()
+
+    def consultas(self, modelo):
+        """Las formas de consulta de las listas públicas."""
+        orden = modelo._meta.ordering
+        activos = modelo.objects.filter(activo=True)
+        return {
+            # Primera página de la lista, con todas las columnas
+            'pagina': activos[:TAMANO_PAGINA],
+            # Solo las columnas del índice (en PostgreSQL, Index Only Scan)
+            'claves': activos.values_list(*orden, 'pk')[:TAMANO_PAGINA],
+            # Lista completa, como la renderizan hoy las páginas y el CV
+            'completa': activos,
+        }
+
+    def medir(self, options):
+        resultados = {}
+        for modelo in MODELOS:
+            medidas = {}
+            for nombre, consulta in self.consultas(modelo).items():
+                list(consulta.all())  # calentamiento
+                tiempos = []
+                for _ in range(options['repeticiones']):
+                    inicio = time.perf_counter()
+                    list(consulta.all())
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                medidas[nombre] = {
+                    'plan': consulta.explain(),
+                    'p50_ms': round(percentil(tiempos, 50), 3),
+                    'p95_ms': round(percentil(tiempos, 95), 3),
+                }
+            resultados[modelo._meta.model_name] = medidas
+        return resultados
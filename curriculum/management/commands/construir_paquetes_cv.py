@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from curriculum import admision, cv, paquetes
+
+
+class Command(BaseCommand):
+    help = (
+        "Construye los paquetes de anexos que falten (por ejemplo tras un despliegue "
+        "con el directorio de caché vacío), ocupando los huecos de generación del CV."
+    )
+
+    def handle(self, *args, **options):
+        for seccion, *_ in cv.SECCIONES_ANEXOS:
+            with admision.turno(con_cola=False):
+                ruta = paquetes.construir(seccion)
+            self.stdout.write(f"{seccion}: {ruta or 'sin paquete'}")
+        self.stdout.write(self.style.SUCCESS("Paquetes revisados."))
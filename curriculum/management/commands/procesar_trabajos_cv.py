@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from curriculum import cola
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa la cola de PDFs del CV en un proceso aparte del servidor web "
+        "(usar junto con CV_TRABAJOS_HILO=False)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help="Vacía la cola y termina.")
+        parser.add_argument('--intervalo', type=float, default=1.0, help="Segundos entre consultas a la cola.")
+
+    def handle(self, *args, **options):
+        while True:
+            procesados = cola.procesar_pendientes()
+            if procesados:
+                self.stdout.write(f"{procesados} trabajos procesados.")
+            if options['una_vez']:
+                cola.limpiar()
+                return
+            if not procesados:
+                cola.limpiar()
+                connection.close()
+                time.sleep(options['intervalo'])
@@ -0,0 +1,45 @@
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger('curriculum.cv')
+
+
+class Cronometro:
+    """Mide etapas con nombre de una petición y las expone como cabecera Server-Timing y como log."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.datos = {}
+
+    @contextmanager
+    def etapa(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.etapas[nombre] = self.etapas.get(nombre, 0) + (time.perf_counter() - inicio) * 1000
+
+    @property
+    def total(self):
+        return (time.perf_counter() - self.inicio) * 1000
+
+    def server_timing(self):
+        partes = [f"{nombre};dur={ms:.1f}" for nombre, ms in self.etapas.items()]
+        partes.append(f"total;dur={self.total:.1f}")
+        return ', '.join(partes)
+
+    def aplicar(self, response):
+        response['Server-Timing'] = self.server_timing()
+        return response
+
+    def registrar(self, evento):
+        """Escribe una línea clave=valor (fácil de filtrar en el agregador de logs) con los datos en `extra`."""
+        campos = {f"{nombre}_ms": round(ms, 1) for nombre, ms in self.etapas.items()}
+        campos['total_ms'] = round(self.total, 1)
+        campos.update(self.datos)
+        logger.info(
+            '%s %s', evento, ' '.join(f"{clave}={valor}" for clave, valor in campos.items()),
+            extra={'evento': evento, 'metricas': campos},
+        )
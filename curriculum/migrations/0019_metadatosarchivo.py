@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('curriculum', '0018_alter_estudiorealizado_fecha_fin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetadatosArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True, verbose_name='Nombre en el storage')),
+                ('es_pdf', models.BooleanField(default=False, verbose_name='Es PDF')),
+                ('paginas', models.PositiveIntegerField(default=0)),
+                ('tamano', models.PositiveBigIntegerField(default=0, verbose_name='Tamaño (bytes)')),
+                ('hash_sha256', models.CharField(blank=True, max_length=64, verbose_name='Hash SHA-256')),
+                ('cifrado', models.BooleanField(default=False, help_text='PDF protegido que no se puede abrir sin contraseña')),
+                ('corrupto', models.BooleanField(default=False, help_text='PDF que no se pudo leer')),
+                ('fecha_analisis', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Metadatos de Archivo',
+                'verbose_name_plural': 'Metadatos de Archivos',
+            },
+        ),
+    ]
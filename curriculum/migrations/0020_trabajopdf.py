@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 10:56
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('curriculum', '0019_metadatosarchivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoPDF',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('clave', models.CharField(db_index=True, help_text='Huella del documento (banderas + versión de los datos)', max_length=64)),
+                ('banderas', models.JSONField(default=dict)),
+                ('base_url', models.CharField(max_length=200)),
+                ('estado', models.CharField(choices=[('PEN', 'Pendiente'), ('PRO', 'En proceso'), ('LIS', 'Listo'), ('ERR', 'Error')], default='PEN', max_length=3)),
+                ('ruta', models.CharField(blank=True, help_text='PDF generado en disco', max_length=500)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Trabajo PDF',
+                'verbose_name_plural': 'Trabajos PDF',
+                'ordering': ['fecha_creacion'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('estado__in', ['PEN', 'PRO'])), fields=('clave',), name='trabajo_pdf_unico_activo')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('curriculum', '0020_trabajopdf'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cursocapacitacion',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_realizacion', 'id'], name='curso_activo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estudiorealizado',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_fin', 'id'], name='estudio_activo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='experiencialaboral',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_inicio', 'id'], name='experiencia_activa_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productoacademico',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_publicacion', 'id'], name='producto_activo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reconocimiento',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_obtencion', 'id'], name='reconocimiento_activo_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='ventagarage',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_publicacion', 'id'], name='venta_activa_fecha_idx'),
+        ),
+    ]
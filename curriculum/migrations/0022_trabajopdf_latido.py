@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('curriculum', '0021_indices_listas_activas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajopdf',
+            name='latido',
+            field=models.DateTimeField(blank=True, help_text='Última señal de vida del worker que lo procesa', null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+import uuid
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import date
@@ -148,7 +149,11 @@ class ExperienciaLaboral(models.Model):
     class Meta:
         verbose_name = "Experiencia Laboral"
         verbose_name_plural = "2. Trayectoria Profesional"
-        ordering = ['fecha_inicio'] 
+        ordering = ['fecha_inicio']
+        indexes = [
+            # Listas públicas: filter(activo=True) ordenado por fecha_inicio
+            models.Index(fields=['fecha_inicio', 'id'], condition=models.Q(activo=True), name='experiencia_activa_fecha_idx'),
+        ]
 
     def clean(self):
         if self.fecha_fin and self.fecha_inicio > self.fecha_fin:
@@ -171,6 +176,10 @@ class EstudioRealizado(models.Model):
         verbose_name = "Título Académico"
         verbose_name_plural = "3. Formación Académica"
         ordering = ['fecha_fin']
+        indexes = [
+            # Listas públicas: filter(activo=True) ordenado por fecha_fin
+            models.Index(fields=['fecha_fin', 'id'], condition=models.Q(activo=True), name='estudio_activo_fecha_idx'),
+        ]
 
     def clean(self):
         # CORRECCIÓN: Verificamos que fecha_fin exista antes de comparar
@@ -193,12 +202,17 @@ class ProductoAcademico(models.Model):
 
     @property
     def tags(self):
-        return self.categorias.all().values_list('nombre', flat=True)
+        # Se recorre categorias.all() para aprovechar un prefetch_related('categorias')
+        return [categoria.nombre for categoria in self.categorias.all()]
 
     class Meta:
         verbose_name = "Producto Académico"
         verbose_name_plural = "4. Producción Intelectual"
         ordering = ['fecha_publicacion']
+        indexes = [
+            # Listas públicas: filter(activo=True) ordenado por fecha_publicacion
+            models.Index(fields=['fecha_publicacion', 'id'], condition=models.Q(activo=True), name='producto_activo_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.registro_id or 'S/N'})"
@@ -216,6 +230,10 @@ class CursoCapacitacion(models.Model):
     class Meta:
         verbose_name_plural = "5. Cursos y Certificaciones"
         ordering = ['fecha_realizacion']
+        indexes = [
+            # Listas públicas: filter(activo=True) ordenado por fecha_realizacion
+            models.Index(fields=['fecha_realizacion', 'id'], condition=models.Q(activo=True), name='curso_activo_fecha_idx'),
+        ]
 
     def __str__(self):
         return self.nombre_curso
@@ -232,6 +250,10 @@ class Reconocimiento(models.Model):
     class Meta:
         verbose_name_plural = "6. Reconocimientos y Premios"
         ordering = ['fecha_obtencion']
+        indexes = [
+            # Listas públicas: filter(activo=True) ordenado por fecha_obtencion
+            models.Index(fields=['fecha_obtencion', 'id'], condition=models.Q(activo=True), name='reconocimiento_activo_fecha'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -257,6 +279,10 @@ class VentaGarage(models.Model):
     class Meta:
         verbose_name_plural = "7. Venta de Garage"
         ordering = ['fecha_publicacion']
+        indexes = [
+            # Listas públicas: filter(activo=True) ordenado por fecha_publicacion
+            models.Index(fields=['fecha_publicacion', 'id'], condition=models.Q(activo=True), name='venta_activa_fecha_idx'),
+        ]
 
     def __str__(self):
         return self.nombre_producto
@@ -278,4 +304,63 @@ class ConfiguracionPagina(models.Model):
         verbose_name_plural = "Configuración de Visibilidad"
 
     def __str__(self):
-        return "Ajustes de Visibilidad de Secciones"
\ No newline at end of file
+        return "Ajustes de Visibilidad de Secciones"
+
+class MetadatosArchivo(models.Model):
+    """Análisis de un archivo subido (certificados y documentos), calculado una sola vez al guardarlo."""
+    nombre = models.CharField(max_length=255, unique=True, verbose_name="Nombre en el storage")
+    es_pdf = models.BooleanField(default=False, verbose_name="Es PDF")
+    paginas = models.PositiveIntegerField(default=0)
+    tamano = models.PositiveBigIntegerField(default=0, verbose_name="Tamaño (bytes)")
+    hash_sha256 = models.CharField(max_length=64, blank=True, verbose_name="Hash SHA-256")
+    cifrado = models.BooleanField(default=False, help_text="PDF protegido que no se puede abrir sin contraseña")
+    corrupto = models.BooleanField(default=False, help_text="PDF que no se pudo leer")
+    fecha_analisis = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Metadatos de Archivo"
+        verbose_name_plural = "Metadatos de Archivos"
+
+    @property
+    def fusionable(self):
+        """Indica si el archivo puede anexarse al PDF del CV."""
+        return self.es_pdf and not self.cifrado and not self.corrupto
+
+    def __str__(self):
+        return self.nombre
+
+class TrabajoPDF(models.Model):
+    """Generación del PDF del CV en segundo plano; la propia tabla hace de cola."""
+    class Estado(models.TextChoices):
+        PENDIENTE = 'PEN', 'Pendiente'
+        EN_PROCESO = 'PRO', 'En proceso'
+        LISTO = 'LIS', 'Listo'
+        ERROR = 'ERR', 'Error'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    clave = models.CharField(max_length=64, db_index=True, help_text="Huella del documento (banderas + versión de los datos)")
+    banderas = models.JSONField(default=dict)
+    base_url = models.CharField(max_length=200)
+    estado = models.CharField(max_length=3, choices=Estado.choices, default=Estado.PENDIENTE)
+    ruta = models.CharField(max_length=500, blank=True, help_text="PDF generado en disco")
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    latido = models.DateTimeField(null=True, blank=True, help_text="Última señal de vida del worker que lo procesa")
+
+    class Meta:
+        verbose_name = "Trabajo PDF"
+        verbose_name_plural = "Trabajos PDF"
+        ordering = ['fecha_creacion']
+        constraints = [
+            # Dos peticiones idénticas a la vez comparten un único trabajo activo
+            models.UniqueConstraint(
+                fields=['clave'],
+                condition=models.Q(estado__in=['PEN', 'PRO']),
+                name='trabajo_pdf_unico_activo',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.get_estado_display()})"
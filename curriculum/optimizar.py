@@ -0,0 +1,87 @@
+import logging
+from django.conf import settings
+
+try:
+    # Opcional: qpdf (vía pikepdf) es el que escribe PDFs linealizados con sus tablas de hints
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+NIVELES = ('ninguna', 'rapida', 'maxima')
+
+logger = logging.getLogger(__name__)
+_sin_pikepdf_avisado = False
+
+
+def _reducir_imagenes(documento):
+    """Reduce las imágenes más grandes que CV_PDF_OPTIMIZACION_MAX_PX (escaneos a 600 ppp, fotos de móvil)."""
+    limite = settings.CV_PDF_OPTIMIZACION_MAX_PX
+    procesadas = set()
+    for pagina in documento.pages:
+        try:
+            imagenes = list(pagina.images)
+        except Exception:
+            continue
+        for imagen in imagenes:
+            referencia = imagen.indirect_reference
+            if referencia is None or referencia.idnum in procesadas:
+                continue
+            procesadas.add(referencia.idnum)
+            try:
+                original = imagen.image
+                # Las imágenes con transparencia o máscara se dejan como están
+                if max(original.size) <= limite or original.mode not in ('RGB', 'L', 'CMYK'):
+                    continue
+                reducida = original.copy()
+                reducida.thumbnail((limite, limite))
+                imagen.replace(reducida, quality=settings.CV_PDF_OPTIMIZACION_CALIDAD)
+            except Exception:
+                logger.exception("No se pudo reducir una imagen del PDF")
+
+
+def optimizar(documento, nivel=None):
+    """
+    Reduce el tamaño del PdfWriter antes de escribirlo.
+
+    - 'rapida': comprime los content streams y unifica los objetos idénticos
+      entre anexos (fuentes, logos y fondos repetidos de una misma institución).
+    - 'maxima': además reduce y recomprime en JPEG las imágenes sobredimensionadas.
+      Es bastante más lenta, pero solo se paga al generar (el resultado queda en caché).
+    """
+    nivel = nivel or settings.CV_PDF_OPTIMIZACION
+    if nivel == 'ninguna':
+        return
+    if nivel == 'maxima':
+        _reducir_imagenes(documento)
+    for pagina in documento.pages:
+        try:
+            pagina.compress_content_streams(level=9 if nivel == 'maxima' else -1)
+        except Exception:
+            logger.exception("No se pudo comprimir una página del PDF")
+    documento.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+
+
+def linealizar(ruta):
+    """
+    Reescribe en su sitio el PDF de `ruta` linealizado ("vista web rápida").
+
+    La primera página y las tablas de hints van al principio del archivo, así
+    que el visor del navegador muestra el CV mientras siguen llegando los
+    anexos (pidiendo el resto con peticiones Range). Si pikepdf no está
+    instalado o falla, el archivo se deja como estaba.
+    """
+    global _sin_pikepdf_avisado
+    if not settings.CV_PDF_LINEALIZADO:
+        return False
+    if pikepdf is None:
+        if not _sin_pikepdf_avisado:
+            _sin_pikepdf_avisado = True
+            logger.warning("CV_PDF_LINEALIZADO está activo pero pikepdf no está instalado: el PDF no se linealiza")
+        return False
+    try:
+        with pikepdf.open(ruta, allow_overwriting_input=True) as documento:
+            documento.save(ruta, linearize=True)
+        return True
+    except Exception:
+        logger.exception("No se pudo linealizar el PDF")
+        return False
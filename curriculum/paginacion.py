@@ -0,0 +1,45 @@
+"""
+Paginación por cursor (keyset) de las listas largas: venta y trabajos.
+
+Cada página continúa a partir del último elemento de la anterior,
+(fecha_publicacion, id) > cursor, en lugar de usar OFFSET: la consulta recorre
+el índice parcial (fecha_publicacion, id) WHERE activo desde ese punto y lee
+solo las filas que muestra, así que la página 1 y la 1000 cuestan lo mismo.
+"""
+import datetime
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+
+ORDEN = ('fecha_publicacion', 'id')
+
+
+def cursor(obj):
+    return f"{obj.fecha_publicacion.isoformat()}_{obj.id}"
+
+
+def leer_cursor(texto):
+    """(fecha, id) del parámetro `despues`; BadRequest (400) si no es un cursor válido."""
+    try:
+        fecha, id_ = texto.split('_')
+        return datetime.date.fromisoformat(fecha), int(id_)
+    except ValueError:
+        raise BadRequest("Cursor de paginación no válido.")
+
+
+def pagina(queryset, despues=None, tamano=None):
+    """
+    Elementos de la página que sigue al cursor `despues` (texto, o None para la
+    primera) y el cursor de la siguiente, o None si es la última.
+    """
+    tamano = tamano or settings.CV_LISTAS_POR_PAGINA
+    queryset = queryset.order_by(*ORDEN)
+    if despues:
+        fecha, id_ = leer_cursor(despues)
+        queryset = queryset.filter(
+            Q(fecha_publicacion__gt=fecha) | Q(fecha_publicacion=fecha, id__gt=id_)
+        )
+    # Un elemento de más indica si hay otra página sin necesidad de un COUNT
+    elementos = list(queryset[:tamano + 1])
+    siguiente = cursor(elementos[tamano - 1]) if len(elementos) > tamano else None
+    return elementos[:tamano], siguiente
@@ -0,0 +1,107 @@
+"""
+Caché de páginas completas para las secciones públicas.
+
+Las páginas públicas son iguales para todos los visitantes anónimos, así que
+se guarda la respuesta ya renderizada (y sus versiones comprimidas con gzip y,
+si está instalado, brotli) por nombre de URL. La clave lleva la versión de los
+modelos de los que depende cada página (versiones.py): al guardar o borrar uno
+de ellos en el admin, las señales renuevan su token y solo las páginas que lo
+usan dejan de encontrarse. Un acierto no toca el ORM ni el motor de plantillas.
+
+No se cachean las peticiones con sesión (admin conectado), con parámetros en
+la URL ni las respuestas que no sean un 200 sin cookies.
+"""
+import re
+import gzip
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from . import versiones
+from .models import DatosPersonales, ConfiguracionPagina
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Modelos que aparecen en todas las páginas (cabecera de base.html y menú)
+MODELOS_BASE = (DatosPersonales, ConfiguracionPagina)
+
+_GZIP = re.compile(r'\bgzip\b')
+_BR = re.compile(r'\bbr\b')
+
+
+def _cacheable(request):
+    return (
+        settings.CV_PAGINAS_TIMEOUT > 0
+        and request.method in ('GET', 'HEAD')
+        and not request.GET
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def _clave(request, nombre, modelos):
+    return f"pagina:{nombre}:{request.get_host()}:{versiones.version_datos(*modelos)}"
+
+
+def _variantes(response):
+    contenido = response.content
+    variantes = {
+        'content_type': response['Content-Type'],
+        'identity': contenido,
+        'gzip': gzip.compress(contenido, mtime=0),
+    }
+    if brotli is not None:
+        variantes['br'] = brotli.compress(contenido)
+    return variantes
+
+
+def _responder(request, variantes):
+    aceptadas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    codificacion = 'identity'
+    if 'br' in variantes and _BR.search(aceptadas):
+        codificacion = 'br'
+    elif _GZIP.search(aceptadas):
+        codificacion = 'gzip'
+
+    response = HttpResponse(variantes[codificacion], content_type=variantes['content_type'])
+    if codificacion != 'identity':
+        response['Content-Encoding'] = codificacion
+    response['Content-Length'] = len(response.content)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def cachear_pagina(*modelos):
+    """
+    Decora una vista pública para servirla desde la caché.
+
+    `modelos` son los modelos propios de la página; los de MODELOS_BASE se
+    añaden siempre.
+    """
+    modelos = MODELOS_BASE + modelos
+
+    def decorador(vista):
+        @wraps(vista)
+        def envoltorio(request, *args, **kwargs):
+            if not _cacheable(request):
+                return vista(request, *args, **kwargs)
+
+            clave = _clave(request, request.resolver_match.url_name, modelos)
+            variantes = cache.get(clave)
+            if variantes is None:
+                response = vista(request, *args, **kwargs)
+                if (
+                    response.status_code != 200
+                    or response.streaming
+                    or response.cookies
+                    or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+                ):
+                    return response
+                variantes = _variantes(response)
+                cache.set(clave, variantes, settings.CV_PAGINAS_TIMEOUT)
+            return _responder(request, variantes)
+        return envoltorio
+    return decorador
@@ -0,0 +1,146 @@
+"""
+Paquetes de anexos pre-fusionados por sección.
+
+Cada vez que cambia un registro de una sección con anexos (nuevo certificado,
+cambio de archivo, activar/desactivar) se reconstruye en segundo plano un único
+PDF con todos los anexos activos de esa sección. Al descargar el CV basta con
+concatenar como mucho cuatro paquetes en lugar de leer y fusionar cada anexo.
+
+El nombre del paquete es la huella de la lista ordenada de archivos, así que un
+paquete nunca se usa si no corresponde exactamente a los anexos actuales.
+"""
+import os
+import hashlib
+import logging
+import threading
+from pypdf import PdfWriter
+from django.conf import settings
+from django.db import connection, transaction
+from . import admision, anexos, archivos, cv
+from .optimizar import optimizar
+
+logger = logging.getLogger(__name__)
+
+_SECCIONES = {seccion: (modelo, campo) for seccion, _, _, modelo, campo in cv.SECCIONES_ANEXOS}
+
+# Secciones con una reconstrucción en curso -> True si hay que repetirla al terminar
+_en_curso = {}
+_lock = threading.Lock()
+
+
+def seccion_de(modelo):
+    for seccion, (modelo_seccion, _) in _SECCIONES.items():
+        if modelo_seccion is modelo:
+            return seccion
+    return None
+
+
+def _ruta(seccion, campos):
+    huella = hashlib.sha256('\n'.join(campo.name for campo in campos).encode()).hexdigest()
+    return os.path.join(settings.CV_PAQUETES_DIR, f"{seccion}-{huella}.pdf")
+
+
+def obtener(seccion, campos):
+    """Ruta del paquete de la sección si está construido para exactamente estos archivos."""
+    ruta = _ruta(seccion, campos)
+    return ruta if os.path.isfile(ruta) else None
+
+
+def construir(seccion):
+    """Fusiona los anexos activos de la sección en un solo PDF y borra los paquetes anteriores."""
+    modelo, campo = _SECCIONES[seccion]
+    campos = cv.filtrar_fusionables([getattr(obj, campo) for obj in modelo.objects.filter(activo=True)])
+    if not campos:
+        return None
+    ruta = _ruta(seccion, campos)
+    if os.path.isfile(ruta):
+        return ruta
+
+    leidos = anexos.leer_anexos(campos)
+    fallidos = [anexo.nombre for anexo in leidos if anexo.error]
+    if fallidos:
+        # Un paquete incompleto no sirve: se seguirá usando la fusión anexo por anexo
+        logger.warning("Paquete '%s' no construido, fallaron: %s", seccion, ', '.join(fallidos))
+        return None
+
+    documento = PdfWriter()
+    for anexo in leidos:
+        if anexo.es_pdf:
+            with anexo.abrir() as flujo:
+                documento.append(flujo)
+        anexo.contenido = None
+    optimizar(documento)
+
+    with archivos.escritura_atomica(ruta) as f:
+        documento.write(f)
+
+    for nombre in os.listdir(settings.CV_PAQUETES_DIR):
+        anterior = os.path.join(settings.CV_PAQUETES_DIR, nombre)
+        if nombre.startswith(f"{seccion}-") and anterior != ruta:
+            try:
+                os.remove(anterior)
+            except OSError:
+                pass
+    return ruta
+
+
+def _trabajar(seccion):
+    try:
+        while True:
+            try:
+                # Comparte los huecos de generación con las descargas del CV
+                with admision.turno(con_cola=False):
+                    construir(seccion)
+            except Exception:
+                logger.exception("Error construyendo el paquete '%s'", seccion)
+            with _lock:
+                if not _en_curso[seccion]:
+                    del _en_curso[seccion]
+                    return
+                _en_curso[seccion] = False
+    finally:
+        connection.close()
+
+
+def _lanzar(seccion):
+    with _lock:
+        if seccion in _en_curso:
+            # Ya hay un hilo trabajando: que repita al terminar con los datos nuevos
+            _en_curso[seccion] = True
+            return
+        _en_curso[seccion] = False
+    threading.Thread(target=_trabajar, args=(seccion,), daemon=True).start()
+
+
+def programar(seccion):
+    """Reconstruye el paquete en segundo plano una vez confirmada la transacción actual."""
+    if settings.CV_PAQUETES_ANEXOS:
+        transaction.on_commit(lambda: _lanzar(seccion))
+
+
+def leer_secciones(secciones, limite=None):
+    """
+    Devuelve los anexos de las secciones indicadas, en orden, listos para fusionar.
+
+    Las secciones con paquete construido aportan un único Anexo (el paquete);
+    las demás se leen anexo por anexo, como antes (hasta `limite`). Aquí no se
+    reconstruye nada: los paquetes solo se programan desde las señales al
+    confirmarse un cambio (o con el comando construir_paquetes_cv).
+    """
+    plan = []
+    sueltos = []
+    for seccion, campos in secciones:
+        if not campos:
+            continue
+        ruta = obtener(seccion, campos) if settings.CV_PAQUETES_ANEXOS else None
+        if ruta:
+            plan.append([anexos.Anexo(f"paquete:{seccion}", ruta=ruta)])
+        else:
+            plan.append(None)
+            sueltos += campos
+
+    leidos = iter(anexos.leer_anexos(sueltos, limite))
+    resultado = []
+    for (seccion, campos), paquete in zip([s for s in secciones if s[1]], plan):
+        resultado += paquete or [next(leidos) for _ in campos]
+    return resultado
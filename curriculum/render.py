@@ -0,0 +1,203 @@
+import io
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from django.conf import settings
+
+# Procesos de render libres (_Proceso), creados al primer uso
+_procesos = None
+_lock = threading.Lock()
+
+# Memoria de link_callback: URI -> ruta local, y URI remota -> momento del último fallo
+_resueltas = {}
+_fallidas = {}
+MAX_RESUELTAS = 1024
+REINTENTO = 300
+# Ruta que no existe: xhtml2pdf registra el recurso como no encontrado y sigue
+NO_DISPONIBLE = os.path.join(os.sep, 'recurso-no-disponible')
+
+
+class ErrorRender(Exception):
+    """No se pudo convertir el HTML del CV a PDF (error de xhtml2pdf, timeout o worker caído)."""
+
+
+def _resolver(uri):
+    """
+    Convierte las URIs de Django (static y media) en rutas de archivos absolutas
+    para que xhtml2pdf pueda encontrarlas en el sistema de archivos.
+    """
+    # Import diferido: este módulo se carga en los workers antes de django.setup()
+    from . import imagenes
+
+    sUrl = settings.STATIC_URL
+    sRoot = settings.STATIC_ROOT
+    mUrl = settings.MEDIA_URL
+    mRoot = settings.MEDIA_ROOT
+
+    # Recursos remotos (Cloudinary u otros): siempre desde una copia local. Las
+    # imágenes además se reducen al tamaño de impresión. Si no se pueden obtener
+    # se devuelve una ruta inexistente para que xhtml2pdf las omita en vez de
+    # descargarlas por su cuenta sin timeout.
+    if uri.startswith(('http://', 'https://')):
+        path = imagenes.recurso_remoto(uri)
+        if not path:
+            return NO_DISPONIBLE
+        if imagenes.es_imagen(uri):
+            return imagenes.derivado_local(path) or path
+        return path
+
+    if uri.startswith(mUrl):
+        path = os.path.join(mRoot, uri.replace(mUrl, ""))
+    elif uri.startswith(sUrl):
+        path = os.path.join(sRoot, uri.replace(sUrl, ""))
+    else:
+        return uri
+
+    # Asegurarse de que path es una cadena válida antes de verificar si es archivo
+    if not os.path.isfile(path):
+        return uri
+    # La foto original puede pesar varios MB; xhtml2pdf solo necesita la versión reducida
+    if imagenes.es_imagen(path):
+        return imagenes.derivado_local(path) or path
+    return path
+
+
+def link_callback(uri, rel):
+    """
+    Resuelve cada URI que pide xhtml2pdf a un archivo local.
+
+    Las resoluciones se memorizan por proceso: los mismos static/media se piden
+    en cada render y no hace falta volver a comprobarlos en la red ni generar
+    otra vez sus derivados; solo se confirma que el archivo sigue en disco.
+    """
+    ruta = _resueltas.get(uri)
+    if ruta:
+        if os.path.isfile(ruta):
+            if ruta.startswith(settings.CV_PDF_DERIVADOS_DIR):
+                # Un derivado en uso no debe ser lo primero que borre la poda (archivos.podar)
+                try:
+                    os.utime(ruta)
+                except OSError:
+                    pass
+            return ruta
+        # Podado o borrado: se vuelve a resolver (y a generar el derivado)
+        _resueltas.pop(uri, None)
+    # Un recurso remoto que acaba de fallar no se vuelve a pedir hasta pasado un rato
+    if time.monotonic() - _fallidas.get(uri, -REINTENTO) < REINTENTO:
+        return NO_DISPONIBLE
+    ruta = _resolver(uri)
+    with _lock:
+        if ruta == NO_DISPONIBLE:
+            if len(_fallidas) >= MAX_RESUELTAS:
+                _fallidas.clear()
+            _fallidas[uri] = time.monotonic()
+        elif ruta and ruta != uri:
+            if len(_resueltas) >= MAX_RESUELTAS:
+                _resueltas.clear()
+            _resueltas[uri] = ruta
+    return ruta
+
+
+def _renderizar(html):
+    from xhtml2pdf import pisa
+
+    buffer = io.BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=buffer, link_callback=link_callback)
+    if pisa_status.err:
+        raise ErrorRender('Hubo un error al generar el PDF principal.')
+    return buffer.getvalue()
+
+
+def _iniciar_worker():
+    # Arranque en caliente: Django, xhtml2pdf y las fuentes de reportlab se cargan
+    # una sola vez por proceso y no en cada CV
+    import django
+    django.setup()
+    _renderizar('<p>.</p>')
+
+
+def _servir(conexion):
+    """Bucle del proceso de render: recibe HTML por el Pipe y devuelve (ok, PDF o mensaje de error)."""
+    _iniciar_worker()
+    while True:
+        try:
+            html = conexion.recv()
+        except EOFError:
+            return
+        try:
+            conexion.send((True, _renderizar(html)))
+        except Exception as e:
+            conexion.send((False, str(e)))
+
+
+class _Proceso:
+    """
+    Un proceso de render precalentado con su propio canal. Cada render ocupa
+    un proceso entero, así que si se cuelga se puede terminar solo ese.
+    """
+
+    def __init__(self):
+        # 'spawn' evita heredar hilos y conexiones abiertas del worker web
+        contexto = multiprocessing.get_context('spawn')
+        self.conexion, remoto = contexto.Pipe()
+        self.proceso = contexto.Process(target=_servir, args=(remoto,), daemon=True)
+        self.proceso.start()
+        remoto.close()
+
+    def renderizar(self, html, timeout):
+        """PDF del HTML; TimeoutError si no termina a tiempo y EOFError si el proceso muere."""
+        self.conexion.send(html)
+        if not self.conexion.poll(timeout):
+            raise TimeoutError()
+        ok, resultado = self.conexion.recv()
+        if not ok:
+            raise ErrorRender(resultado)
+        return resultado
+
+    def terminar(self):
+        self.proceso.terminate()
+        self.proceso.join()
+        self.conexion.close()
+
+
+def _libres():
+    """Cola de procesos libres; se lanzan todos de inmediato para no pagar el arranque en una petición."""
+    global _procesos
+    with _lock:
+        if _procesos is None:
+            _procesos = queue.Queue()
+            for _ in range(settings.CV_RENDER_PROCESOS):
+                _procesos.put(_Proceso())
+        return _procesos
+
+
+def renderizar_pdf(html):
+    """
+    Convierte el HTML del CV en los bytes del PDF.
+
+    Con CV_RENDER_PROCESOS > 0 el trabajo (CPU puro en xhtml2pdf) se hace en
+    procesos aparte, así un render no bloquea por el GIL al resto de peticiones
+    del worker. Un render que supera CV_RENDER_TIMEOUT o que tumba su proceso
+    solo afecta a esa petición: se termina ese proceso y se lanza otro en su
+    lugar, sin tocar los renders en curso en los demás.
+    """
+    if settings.CV_RENDER_PROCESOS <= 0:
+        return _renderizar(html)
+
+    libres = _libres()
+    proceso = libres.get()
+    try:
+        resultado = proceso.renderizar(html, settings.CV_RENDER_TIMEOUT)
+    except TimeoutError:
+        proceso.terminar()
+        proceso = _Proceso()
+        raise ErrorRender('El PDF principal tardó demasiado en generarse.')
+    except (EOFError, OSError):
+        proceso.terminar()
+        proceso = _Proceso()
+        raise ErrorRender('El proceso que generaba el PDF terminó inesperadamente.')
+    finally:
+        libres.put(proceso)
+    return resultado
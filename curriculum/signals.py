@@ -0,0 +1,126 @@
+import logging
+import threading
+from django.db import connection, transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from . import anexos, imagenes, paquetes, versiones
+from .models import (
+    DatosPersonales, Idioma, ExperienciaLaboral, EstudioRealizado,
+    CursoCapacitacion, Reconocimiento, ProductoAcademico, VentaGarage,
+    CategoriaTag, ConfiguracionPagina, MetadatosArchivo
+)
+
+logger = logging.getLogger(__name__)
+
+MODELOS_VERSIONADOS = (
+    DatosPersonales, Idioma, ExperienciaLaboral, EstudioRealizado,
+    CursoCapacitacion, Reconocimiento, ProductoAcademico, VentaGarage,
+    CategoriaTag, ConfiguracionPagina,
+)
+
+# Campos cuyos archivos se anexan al PDF del CV
+CAMPOS_ANEXO = {
+    ExperienciaLaboral: 'certificado_pdf',
+    EstudioRealizado: 'certificado_pdf',
+    CursoCapacitacion: 'certificado_pdf',
+    ProductoAcademico: 'archivo',
+}
+
+# Imágenes que se incrustan (o pueden incrustarse) en el PDF
+CAMPOS_IMAGEN = {
+    DatosPersonales: 'foto',
+    VentaGarage: 'imagen',
+}
+
+
+def _invalidar(modelo):
+    """
+    Renueva la versión del modelo ahora y otra vez al confirmarse la transacción.
+
+    Mientras la transacción del admin sigue abierta, otra petición puede leer
+    las filas anteriores con el token nuevo y guardarlas en caché bajo él; la
+    segunda renovación, ya con los datos confirmados, deja esas entradas sin uso.
+    """
+    versiones.invalidar(modelo)
+    transaction.on_commit(lambda: versiones.invalidar(modelo))
+
+
+def renovar_version(sender, **kwargs):
+    _invalidar(sender)
+
+
+def renovar_version_categorias(sender, action, **kwargs):
+    # Cambiar las etiquetas de un producto no dispara post_save del producto
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidar(ProductoAcademico)
+
+
+def marcar_archivo_nuevo(sender, instance, **kwargs):
+    # Antes de guardar, un archivo recién subido todavía no está confirmado en el storage
+    campo = getattr(instance, CAMPOS_ANEXO[sender])
+    instance._anexo_nuevo = bool(campo) and not campo._committed
+
+
+def _en_segundo_plano(funcion, *args):
+    """Ejecuta `funcion` en un hilo cuando se confirme la transacción: el guardado del admin no la espera."""
+    transaction.on_commit(lambda: threading.Thread(target=funcion, args=args, daemon=True).start())
+
+
+def _analizar(campo, seccion):
+    try:
+        anexos.analizar(campo)
+        # Con los metadatos registrados el paquete ya descarta el anexo si no se puede fusionar
+        paquetes.programar(seccion)
+    except Exception:
+        logger.exception(
+            "Error analizando el anexo %s; se puede completar con `manage.py analizar_anexos`", campo.name
+        )
+    finally:
+        connection.close()
+
+
+def analizar_anexo(sender, instance, **kwargs):
+    campo = getattr(instance, CAMPOS_ANEXO[sender])
+    if not campo:
+        return
+    if getattr(instance, '_anexo_nuevo', False) or not MetadatosArchivo.objects.filter(nombre=campo.name).exists():
+        # La descarga del archivo no retiene el guardado del admin ni su transacción
+        _en_segundo_plano(_analizar, campo, paquetes.seccion_de(sender))
+
+
+def reconstruir_paquete(sender, **kwargs):
+    # Certificado nuevo, cambiado, borrado o activado/desactivado
+    paquetes.programar(paquetes.seccion_de(sender))
+
+
+def _preparar(campo):
+    try:
+        imagenes.preparar(campo)
+    except Exception:
+        logger.exception("Error preparando la imagen %s", campo.name)
+
+
+def preparar_imagen(sender, instance, **kwargs):
+    campo = getattr(instance, CAMPOS_IMAGEN[sender])
+    if campo:
+        # En Cloudinary hay que descargarla y recodificarla: fuera de la petición del admin
+        _en_segundo_plano(_preparar, campo)
+
+
+def conectar():
+    for modelo in MODELOS_VERSIONADOS:
+        uid = f"version-{modelo._meta.label_lower}"
+        post_save.connect(renovar_version, sender=modelo, dispatch_uid=f"{uid}-save")
+        post_delete.connect(renovar_version, sender=modelo, dispatch_uid=f"{uid}-delete")
+    for modelo in CAMPOS_ANEXO:
+        uid = f"anexo-{modelo._meta.label_lower}"
+        pre_save.connect(marcar_archivo_nuevo, sender=modelo, dispatch_uid=f"{uid}-pre")
+        post_save.connect(analizar_anexo, sender=modelo, dispatch_uid=f"{uid}-post")
+        post_save.connect(reconstruir_paquete, sender=modelo, dispatch_uid=f"{uid}-paquete-save")
+        post_delete.connect(reconstruir_paquete, sender=modelo, dispatch_uid=f"{uid}-paquete-delete")
+    for modelo in CAMPOS_IMAGEN:
+        post_save.connect(preparar_imagen, sender=modelo, dispatch_uid=f"imagen-{modelo._meta.label_lower}")
+    m2m_changed.connect(
+        renovar_version_categorias,
+        sender=ProductoAcademico.categorias.through,
+        dispatch_uid='version-productoacademico-categorias'
+    )
@@ -1,3 +1,994 @@
-from django.test import TestCase
+import io
+import os
+import mmap
+import random
+import shutil
+import datetime
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from contextlib import contextmanager
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import OperationalError
+from django.http import FileResponse, HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import (
+    admision, anexos, archivos, cache_pdf, cola, cv, generador, imagenes, instantanea, optimizar, paquetes,
+    render, versiones, views,
+)
+from .management.commands import benchmark_indices
+from .models import (
+    DatosPersonales, Idioma, ExperienciaLaboral, EstudioRealizado, CursoCapacitacion,
+    Reconocimiento, ProductoAcademico, VentaGarage, CategoriaTag, ConfiguracionPagina,
+    MetadatosArchivo, TrabajoPDF
+)
 
-# Create your tests here.
+# Consultas permitidas por URL. No dependen del número de filas: cada lista se
+# carga con una consulta (y sus relaciones con un prefetch), nunca una por fila.
+# Las tres primeras de cada página son la instantánea del perfil (perfil,
+# idiomas y configuración), que en producción se reutiliza entre peticiones.
+PRESUPUESTO = {
+    'inicio': 3,
+    'perfil': 3,
+    'experiencia': 4,
+    'educacion': 4,
+    'cursos': 4,
+    'reconocimientos': 4,
+    'trabajos': 5,
+    'trabajos_mas': 5,
+    'venta': 4,
+    'venta_mas': 4,
+    'contacto': 3,
+    'checkout': 3,
+    'generar_cv': 7,
+    'descargar_pdf': 9,
+    'encolar_cv': 4,  # SELECT + INSERT dentro de un savepoint
+    'estado_cv': 1,
+    'descargar_trabajo_cv': 1,
+    'capacidad_cv': 2,
+}
+
+
+def pdf_vacio():
+    documento = PdfWriter()
+    documento.add_blank_page(595, 842)
+    buffer = io.BytesIO()
+    documento.write(buffer)
+    return buffer.getvalue()
+
+
+AJUSTES = override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_PAGINAS_TIMEOUT=0,
+    CV_RENDER_PROCESOS=0,
+    CV_RENDER_SIMULTANEOS=0,
+    CV_PAQUETES_ANEXOS=False,
+    CV_TRABAJOS_HILO=False,
+    CV_PDF_LINEALIZADO=False,
+    ALLOWED_HOSTS=['testserver'],
+)
+
+
+class DirectorioTemporalMixin:
+    """
+    Cada prueba trabaja en su propio directorio temporal (`self.directorio`),
+    que sustituye a los directorios de los ajustes de `ajustes_directorio`.
+    """
+    ajustes_directorio = ()
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp(prefix='cv-tests-')
+        self.addCleanup(shutil.rmtree, self.directorio)
+        ajustes = override_settings(**{nombre: self.directorio for nombre in self.ajustes_directorio})
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+class PresupuestoConsultasMixin(DirectorioTemporalMixin):
+    """Mismo número de consultas por URL con pocas y con muchas filas por sección."""
+    filas = None
+    ajustes_directorio = ('CV_PDF_CACHE_DIR', 'CV_TRABAJOS_DIR')
+
+    @classmethod
+    def setUpTestData(cls):
+        hoy = datetime.date(2024, 1, 1)
+        perfil = DatosPersonales.objects.create(
+            cedula='0000000000', nombres='Perfil', apellidos='Prueba', sexo='Otro',
+            estado_civil='Soltera/o', telefono='0990000000', email='perfil@example.com',
+            direccion='Dirección de prueba', descripcion_perfil='Resumen profesional.',
+        )
+        Idioma.objects.create(nombre='Español', nivel='Nativo', perfil=perfil)
+        Idioma.objects.create(nombre='Inglés', nivel='B2', perfil=perfil)
+        ConfiguracionPagina.objects.create()
+
+        dias = [hoy - datetime.timedelta(days=i) for i in range(cls.filas)]
+        ExperienciaLaboral.objects.bulk_create(
+            ExperienciaLaboral(cargo=f'Cargo {i}', empresa='Empresa', fecha_inicio=dia)
+            for i, dia in enumerate(dias)
+        )
+        EstudioRealizado.objects.bulk_create(
+            EstudioRealizado(titulo=f'Título {i}', institucion='Universidad', fecha_inicio=dia, fecha_fin=dia)
+            for i, dia in enumerate(dias)
+        )
+        CursoCapacitacion.objects.bulk_create(
+            CursoCapacitacion(nombre_curso=f'Curso {i}', institucion='Instituto', fecha_realizacion=dia, horas=10)
+            for i, dia in enumerate(dias)
+        )
+        Reconocimiento.objects.bulk_create(
+            Reconocimiento(nombre=f'Premio {i}', institucion='Institución', fecha_obtencion=dia)
+            for i, dia in enumerate(dias)
+        )
+        VentaGarage.objects.bulk_create(
+            VentaGarage(nombre_producto=f'Artículo {i}', precio=10, estado='Bueno', fecha_publicacion=dia)
+            for i, dia in enumerate(dias)
+        )
+        proyectos = ProductoAcademico.objects.bulk_create(
+            ProductoAcademico(nombre=f'Proyecto {i}', fecha_publicacion=dia)
+            for i, dia in enumerate(dias)
+        )
+        categorias = CategoriaTag.objects.bulk_create(CategoriaTag(nombre=f'tag{i}') for i in range(3))
+        Relacion = ProductoAcademico.categorias.through
+        Relacion.objects.bulk_create(
+            Relacion(productoacademico=proyecto, categoriatag=categoria)
+            for proyecto in proyectos for categoria in categorias
+        )
+
+        cls.staff = get_user_model().objects.create_user('staff', password='x', is_staff=True)
+
+    def setUp(self):
+        # Cada prueba parte sin instantánea ni PDFs generados: se cuentan todas las consultas
+        super().setUp()
+        instantanea._actual = None
+
+        self.trabajo = TrabajoPDF.objects.create(
+            clave='0' * 64, banderas={}, base_url='http://testserver', estado=TrabajoPDF.Estado.LISTO,
+            ruta=f'{self.directorio}/trabajo.pdf',
+        )
+        with open(self.trabajo.ruta, 'wb') as f:
+            f.write(pdf_vacio())
+
+    def comprobar(self, nombre, metodo='get', url=None, **kwargs):
+        url = url or reverse(nombre)
+        with self.assertNumQueries(PRESUPUESTO[nombre]):
+            response = getattr(self.client, metodo)(url, **kwargs)
+        self.assertLess(response.status_code, 400)
+        return response
+
+    def test_paginas_publicas(self):
+        for nombre in (
+            'inicio', 'perfil', 'experiencia', 'educacion', 'cursos',
+            'reconocimientos', 'trabajos', 'venta', 'contacto', 'checkout', 'generar_cv',
+        ):
+            with self.subTest(nombre):
+                instantanea._actual = None
+                self.comprobar(nombre)
+
+    def test_trabajos_muestra_categorias(self):
+        response = self.comprobar('trabajos')
+        self.assertContains(response, '#tag2', count=min(self.filas, settings.CV_LISTAS_POR_PAGINA))
+
+    def test_paginacion_por_cursor(self):
+        for nombre, modelo, clave in (
+            ('trabajos', ProductoAcademico, 'proyectos'),
+            ('venta', VentaGarage, 'productos'),
+        ):
+            with self.subTest(nombre):
+                instantanea._actual = None
+                response = self.comprobar(nombre)
+                vistos = [obj.id for obj in response.context[clave]]
+                despues = response.context['siguiente']
+                while despues:
+                    instantanea._actual = None
+                    response = self.comprobar(f'{nombre}_mas', url=f"{reverse(f'{nombre}_mas')}?despues={despues}")
+                    vistos += [obj.id for obj in response.context[clave]]
+                    despues = response.get('X-Siguiente')
+                esperados = list(modelo.objects.filter(activo=True).order_by('fecha_publicacion', 'id').values_list('id', flat=True))
+                self.assertEqual(vistos, esperados)
+
+    def test_cursor_no_valido(self):
+        self.assertEqual(self.client.get(reverse('venta_mas'), {'despues': 'x'}).status_code, 400)
+
+    @mock.patch('curriculum.generador.renderizar_pdf', side_effect=lambda html: pdf_vacio())
+    def test_descargar_pdf(self, renderizar):
+        response = self.comprobar('descargar_pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        renderizar.assert_called_once()
+        # Se envía desde el archivo de la caché por bloques, con su tamaño en Content-Length
+        self.assertIsInstance(response, FileResponse)
+        contenido = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(contenido))
+        with open(cache_pdf.obtener(response['ETag'].strip('"')), 'rb') as f:
+            self.assertEqual(f.read(), contenido)
+
+    def test_trabajos_pdf(self):
+        self.comprobar('encolar_cv', metodo='post')
+        self.comprobar('estado_cv', url=reverse('estado_cv', args=[self.trabajo.id]))
+        self.comprobar('descargar_trabajo_cv', url=reverse('descargar_trabajo_cv', args=[self.trabajo.id]))
+
+    def test_capacidad(self):
+        self.client.force_login(self.staff)
+        self.comprobar('capacidad_cv')
+
+
+@AJUSTES
+class PresupuestoConsultasPocasFilasTests(PresupuestoConsultasMixin, TestCase):
+    filas = 10
+
+
+@AJUSTES
+class PresupuestoConsultasMuchasFilasTests(PresupuestoConsultasMixin, TestCase):
+    filas = 1000
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_PAGINAS_TIMEOUT=60,
+    ALLOWED_HOSTS=['testserver'],
+)
+class CachePaginasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        DatosPersonales.objects.create(
+            cedula='0000000000', nombres='Perfil', apellidos='Prueba', sexo='Otro',
+            estado_civil='Soltera/o', telefono='0990000000', email='perfil@example.com',
+            direccion='Dirección de prueba',
+        )
+        ConfiguracionPagina.objects.create()
+        ExperienciaLaboral.objects.create(cargo='Cargo inicial', empresa='Empresa', fecha_inicio=datetime.date(2024, 1, 1))
+
+    def test_acierto_sin_consultas_e_invalidacion(self):
+        self.client.get(reverse('experiencia'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('experiencia'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        experiencia = ExperienciaLaboral.objects.get()
+        experiencia.cargo = 'Cargo nuevo'
+        experiencia.save()
+        self.assertContains(self.client.get(reverse('experiencia')), 'Cargo nuevo')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_PAQUETES_ANEXOS=False,
+)
+class VersionesTests(TestCase):
+    def token(self):
+        return versiones.tokens(ExperienciaLaboral)[ExperienciaLaboral]
+
+    def test_se_renueva_al_confirmar_la_transaccion(self):
+        antes = self.token()
+        with self.captureOnCommitCallbacks(execute=True):
+            ExperienciaLaboral.objects.create(cargo='Cargo', empresa='Empresa', fecha_inicio=datetime.date(2024, 1, 1))
+            # Lo que otra petición cachee ahora (aún con las filas sin confirmar) usa este token
+            durante = self.token()
+        self.assertNotEqual(durante, antes)
+        self.assertNotEqual(self.token(), durante)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_RENDER_PROCESOS=0,
+)
+class PresupuestoTiempoTests(DirectorioTemporalMixin, TestCase):
+    ajustes_directorio = ('CV_PDF_CACHE_DIR',)
+
+    @mock.patch('curriculum.generador.renderizar_pdf', side_effect=lambda html: pdf_vacio())
+    @mock.patch('curriculum.paquetes.leer_secciones', return_value=[])
+    def test_solo_con_limite_explicito(self, leer_secciones, renderizar):
+        # Trabajos en segundo plano: sin límite se espera a todos los anexos
+        generador.generar(cv.leer_banderas({}), 'http://testserver')
+        self.assertIsNone(leer_secciones.call_args.args[1])
+
+        generador.generar(cv.leer_banderas({}), 'http://testserver', limite=100.0)
+        self.assertEqual(leer_secciones.call_args.args[1], 100.0 - settings.CV_PDF_RESERVA)
+
+    @mock.patch('curriculum.views.generar_respuesta', return_value=HttpResponse())
+    def test_la_espera_de_turno_no_descuenta_del_presupuesto(self, generar_respuesta):
+        admitida = []
+
+        @contextmanager
+        def turno(cronometro=None):
+            time.sleep(0.2)  # esperando en la cola
+            admitida.append(time.monotonic())
+            yield
+
+        with mock.patch('curriculum.admision.turno', turno):
+            self.client.get(reverse('descargar_pdf'))
+        limite = generar_respuesta.call_args.args[5]
+        self.assertGreaterEqual(limite, admitida[0] + settings.CV_PDF_PRESUPUESTO)
+
+    def test_los_anexos_locales_se_leen_aunque_no_quede_tiempo(self):
+        ruta = os.path.join(self.directorio, 'certificado.pdf')
+        with open(ruta, 'wb') as f:
+            f.write(pdf_vacio())
+        local = SimpleNamespace(name='experiencia/certificado.pdf', url='/media/experiencia/certificado.pdf', path=ruta)
+        remoto = SimpleNamespace(name='cursos/certificado.pdf', url='http://127.0.0.1:9/cursos/certificado.pdf')
+
+        leidos = anexos.leer_anexos([remoto, local], limite=time.monotonic() - 1)
+        self.assertIsNotNone(leidos[0].error)
+        self.assertIsNone(leidos[1].error)
+        self.assertEqual(leidos[1].ruta, ruta)
+
+    @mock.patch('curriculum.cv.renderizar_pdf', side_effect=lambda html: pdf_vacio())
+    @mock.patch('curriculum.generador.renderizar_pdf', side_effect=lambda html: pdf_vacio())
+    @mock.patch('curriculum.paquetes.leer_secciones')
+    def test_anexo_omitido_se_sustituye_por_su_enlace(self, leer_secciones, renderizar, renderizar_enlace):
+        leer_secciones.return_value = [
+            anexos.Anexo('cursos/certificado.pdf', error='Tiempo agotado', url='/media/cursos/certificado.pdf'),
+        ]
+        with override_settings(CV_RENDER_SIMULTANEOS=0, ALLOWED_HOSTS=['testserver']):
+            response = self.client.get(reverse('descargar_pdf'))
+
+        self.assertEqual(response['X-CV-Anexos-Omitidos'], 'cursos/certificado.pdf')
+        self.assertTrue(response.streaming)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertNotIn('ETag', response)
+        # Página del CV + página con el enlace al certificado omitido
+        contenido = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(contenido))
+        documento = PdfReader(io.BytesIO(contenido))
+        self.assertEqual(len(documento.pages), 2)
+        self.assertIn('certificado.pdf', renderizar_enlace.call_args.args[0])
+        # El documento degradado no se guarda en la caché
+        self.assertEqual(os.listdir(self.directorio), [])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_RENDER_PROCESOS=0,
+    CV_RENDER_SIMULTANEOS=0,
+    CV_PDF_LINEALIZADO=False,
+    ALLOWED_HOSTS=['testserver'],
+)
+class MetricasTests(DirectorioTemporalMixin, TestCase):
+    ajustes_directorio = ('CV_PDF_CACHE_DIR',)
+
+    @mock.patch('curriculum.generador.renderizar_pdf', side_effect=lambda html: pdf_vacio())
+    @mock.patch('curriculum.paquetes.leer_secciones')
+    def test_server_timing_y_log_por_peticion(self, leer_secciones, renderizar):
+        certificado = os.path.join(self.directorio, 'certificado.pdf')
+        with open(certificado, 'wb') as f:
+            f.write(pdf_vacio())
+        leer_secciones.return_value = [anexos.Anexo('cursos/certificado.pdf', ruta=certificado)]
+
+        with self.assertLogs('curriculum.cv', 'INFO') as logs:
+            response = self.client.get(reverse('descargar_pdf'))
+
+        etapas = [parte.split(';')[0] for parte in response['Server-Timing'].split(', ')]
+        for etapa in ('cache', 'db', 'html', 'pdf', 'anexos', 'fusion', 'escritura'):
+            self.assertIn(etapa, etapas)
+        self.assertEqual(etapas[-1], 'total')
+
+        registro, = [registro for registro in logs.records if registro.evento == 'cv_pdf']
+        self.assertEqual(registro.metricas['cache'], 'miss')
+        self.assertEqual(registro.metricas['anexos'], 1)
+        self.assertEqual(registro.metricas['paginas'], 2)
+        self.assertEqual(registro.metricas['errores_anexos'], 0)
+        self.assertIn('pdf_ms', registro.metricas)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_PAGINAS_TIMEOUT=0,
+)
+class InstantaneaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        DatosPersonales.objects.create(
+            cedula='0000000000', nombres='Perfil', apellidos='Prueba', sexo='Otro',
+            estado_civil='Soltera/o', telefono='0990000000', email='perfil@example.com',
+            direccion='Dirección de prueba',
+        )
+        ConfiguracionPagina.objects.create()
+
+    def test_reutilizada_sin_consultas_y_una_lectura_de_version_por_peticion(self):
+        instantanea._actual = None
+        self.client.get(reverse('inicio'))
+        with mock.patch.object(versiones, 'tokens', wraps=versiones.tokens) as tokens:
+            with self.assertNumQueries(0):
+                self.client.get(reverse('contacto'))
+        # Context processor, vista y plantilla comparten la versión leída al principio
+        self.assertEqual(tokens.call_count, 1)
+
+    def test_un_cambio_se_ve_en_la_siguiente_peticion(self):
+        self.client.get(reverse('inicio'))
+        perfil = DatosPersonales.objects.get()
+        perfil.nombres = 'Nombre nuevo'
+        perfil.save()
+        self.assertContains(self.client.get(reverse('inicio')), 'Nombre nuevo')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FragmentosCvTests(TestCase):
+    def test_datos_leidos_antes_de_un_cambio_no_quedan_bajo_la_version_nueva(self):
+        DatosPersonales.objects.create(
+            cedula='0000000000', nombres='Perfil', apellidos='Prueba', sexo='Otro',
+            estado_civil='Soltera/o', telefono='0990000000', email='perfil@example.com',
+            direccion='Dirección de prueba',
+        )
+        experiencia = ExperienciaLaboral.objects.create(
+            cargo='Cargo anterior', empresa='Empresa', fecha_inicio=datetime.date(2024, 1, 1),
+        )
+        banderas = cv.leer_banderas({})
+        instantanea._actual = None
+        datos = cv.consultar_datos()
+
+        # El cambio se confirma mientras la generación anterior sigue en curso
+        experiencia.cargo = 'Cargo nuevo'
+        experiencia.save()
+        self.assertIn('Cargo anterior', cv.renderizar_html(datos, banderas, 'http://testserver'))
+
+        html = cv.renderizar_html(cv.consultar_datos(), banderas, 'http://testserver')
+        self.assertIn('Cargo nuevo', html)
+        self.assertNotIn('Cargo anterior', html)
+
+
+class RangosPdfTests(DirectorioTemporalMixin, TestCase):
+    """Peticiones Range y revalidación del PDF ya generado (visor del navegador)."""
+
+    def setUp(self):
+        super().setUp()
+        self.ruta = f'{self.directorio}/cv.pdf'
+        self.contenido = pdf_vacio()
+        with open(self.ruta, 'wb') as f:
+            f.write(self.contenido)
+        self.clave = 'a' * 64
+
+    def pedir(self, **cabeceras):
+        request = RequestFactory().get('/cv/', headers=cabeceras)
+        return views.respuesta_pdf(self.ruta, request, self.clave)
+
+    def test_rango(self):
+        response = self.pedir(Range='bytes=0-99')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[:100])
+        self.assertEqual(response['Content-Range'], f'bytes 0-99/{len(self.contenido)}')
+        self.assertEqual(response['ETag'], f'"{self.clave}"')
+
+    def test_rango_sufijo(self):
+        # El visor empieza por el final, donde están la tabla xref y el trailer
+        response = self.pedir(Range='bytes=-50')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[-50:])
+
+    def test_rango_no_satisfacible(self):
+        response = self.pedir(Range=f'bytes={len(self.contenido)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.contenido)}')
+
+    def test_if_range_de_otra_version_envia_el_archivo_entero(self):
+        response = self.pedir(Range='bytes=0-99', **{'If-Range': '"otra"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido)
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        CV_PDF_LINEALIZADO=False,
+    )
+    def test_no_modificado(self):
+        with override_settings(CV_PDF_CACHE_DIR=os.path.dirname(self.ruta)):
+            clave = cache_pdf.clave_cv(cv.leer_banderas({}), 'http://testserver')
+            documento = PdfWriter()
+            documento.add_blank_page(595, 842)
+            cache_pdf.guardar(clave, documento)
+            response = self.client.get(reverse('descargar_pdf'), headers={'If-None-Match': f'"{clave}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+
+def pdf_escaneado(ancho=2000, alto=1000):
+    """Una página con una sola imagen, como la de un certificado escaneado."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (ancho, alto), 'white').save(buffer, 'PDF')
+    return buffer.getvalue()
+
+
+class OptimizarTests(TestCase):
+    def documento(self):
+        # El mismo escaneo adjunto dos veces, como dos certificados de una institución
+        documento = PdfWriter()
+        for _ in range(2):
+            documento.append(PdfReader(io.BytesIO(pdf_escaneado())))
+        return documento
+
+    def escribir(self, documento):
+        buffer = io.BytesIO()
+        documento.write(buffer)
+        return buffer.getvalue()
+
+    def test_rapida_unifica_los_objetos_repetidos(self):
+        sin_optimizar = self.documento()
+        optimizar.optimizar(sin_optimizar, 'ninguna')
+        rapida = self.documento()
+        optimizar.optimizar(rapida, 'rapida')
+        self.assertLess(len(self.escribir(rapida)), len(self.escribir(sin_optimizar)) * 0.6)
+
+    @override_settings(CV_PDF_OPTIMIZACION_MAX_PX=500)
+    def test_maxima_reduce_las_imagenes_grandes(self):
+        documento = self.documento()
+        optimizar.optimizar(documento, 'maxima')
+        lector = PdfReader(io.BytesIO(self.escribir(documento)))
+        tamanos = [imagen.image.size for pagina in lector.pages for imagen in pagina.images]
+        self.assertEqual(tamanos, [(500, 250), (500, 250)])
+
+
+@override_settings(CV_PDF_LINEALIZADO=True)
+class LinealizarTests(DirectorioTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ruta = f'{self.directorio}/cv.pdf'
+        with open(self.ruta, 'wb') as f:
+            f.write(pdf_vacio())
+
+    @skipUnless(optimizar.pikepdf, "pikepdf no está instalado")
+    def test_linealiza(self):
+        self.assertTrue(optimizar.linealizar(self.ruta))
+        with open(self.ruta, 'rb') as f:
+            self.assertIn(b'/Linearized', f.read(1024))
+
+    @mock.patch('curriculum.optimizar.pikepdf', None)
+    @mock.patch('curriculum.optimizar._sin_pikepdf_avisado', False)
+    def test_sin_pikepdf_avisa(self):
+        with self.assertLogs('curriculum.optimizar', 'WARNING'):
+            self.assertFalse(optimizar.linealizar(self.ruta))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'}},
+)
+class SegundoPlanoTests(DirectorioTemporalMixin, TestCase):
+    """Trabajo de las señales que se hace fuera de la petición del admin."""
+    ajustes_directorio = ('MEDIA_ROOT',)
+
+    @mock.patch('curriculum.signals.connection')
+    @mock.patch('curriculum.signals.paquetes.programar')
+    @mock.patch('curriculum.signals.threading.Thread')
+    @mock.patch('curriculum.anexos.analizar')
+    def test_se_analiza_en_segundo_plano_al_confirmar(self, analizar, hilo, programar, connection):
+        with self.captureOnCommitCallbacks() as pendientes:
+            ExperienciaLaboral.objects.create(
+                cargo='Cargo', empresa='Empresa', fecha_inicio=datetime.date(2024, 1, 1),
+                certificado_pdf=ContentFile(pdf_vacio(), name='certificado.pdf'),
+            )
+        # El guardado (y su transacción) termina sin haber descargado el archivo
+        analizar.assert_not_called()
+        hilo.assert_not_called()
+
+        for funcion in pendientes:
+            funcion()
+        hilo.return_value.start.assert_called_once()
+        hilo.call_args.kwargs['target'](*hilo.call_args.kwargs['args'])
+        analizar.assert_called_once()
+        programar.assert_called_with('experiencia')
+
+    @mock.patch('curriculum.signals.threading.Thread')
+    @mock.patch('curriculum.imagenes.preparar')
+    def test_la_imagen_se_prepara_en_segundo_plano_al_confirmar(self, preparar, hilo):
+        with self.captureOnCommitCallbacks() as pendientes:
+            VentaGarage.objects.create(
+                nombre_producto='Artículo', precio=10, estado='Bueno', fecha_publicacion=datetime.date(2024, 1, 1),
+                imagen=ContentFile(b'GIF89a', name='articulo.gif'),
+            )
+        preparar.assert_not_called()
+        hilo.assert_not_called()
+
+        for funcion in pendientes:
+            funcion()
+        hilo.call_args.kwargs['target'](*hilo.call_args.kwargs['args'])
+        preparar.assert_called_once()
+
+    @mock.patch('curriculum.anexos.time.sleep')
+    def test_reintenta_si_la_base_de_datos_esta_bloqueada(self, sleep):
+        experiencia = ExperienciaLaboral.objects.create(
+            cargo='Cargo', empresa='Empresa', fecha_inicio=datetime.date(2024, 1, 1),
+            certificado_pdf=ContentFile(pdf_vacio(), name='certificado.pdf'),
+        )
+        original = MetadatosArchivo.objects.update_or_create
+        intentos = []
+
+        def update_or_create(**kwargs):
+            # Otra escritura retiene la base de datos durante los dos primeros intentos
+            intentos.append(kwargs)
+            if len(intentos) <= 2:
+                raise OperationalError('database is locked')
+            return original(**kwargs)
+
+        with mock.patch.object(MetadatosArchivo.objects, 'update_or_create', side_effect=update_or_create):
+            metadatos = anexos.analizar(experiencia.certificado_pdf)
+        self.assertEqual(metadatos.paginas, 1)
+        self.assertEqual(sleep.call_count, 2)
+
+
+@override_settings(CV_PAQUETES_ANEXOS=True)
+class PaquetesTests(DirectorioTemporalMixin, TestCase):
+    ajustes_directorio = ('CV_PAQUETES_DIR',)
+
+    @mock.patch('curriculum.paquetes._lanzar')
+    @mock.patch('curriculum.anexos.leer_anexos', side_effect=lambda campos, limite=None: list(campos))
+    def test_descarga_sin_paquete_no_lo_reconstruye(self, leer_anexos, lanzar):
+        campos = [SimpleNamespace(name='experiencia/certificado.pdf')]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(paquetes.leer_secciones([('experiencia', campos)]), campos)
+        lanzar.assert_not_called()
+
+
+@skipUnless(admision.fcntl, "sin fcntl no hay control de admisión")
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_RENDER_SIMULTANEOS=1,
+    CV_RENDER_COLA=1,
+    CV_RENDER_ESPERA=1,
+    ALLOWED_HOSTS=['testserver'],
+)
+class AdmisionTests(DirectorioTemporalMixin, TestCase):
+    ajustes_directorio = ('CV_ADMISION_DIR', 'CV_PDF_CACHE_DIR')
+
+    def setUp(self):
+        super().setUp()
+        # Otra generación ocupa el único hueco (desde otro worker, por ejemplo)
+        self.hueco = admision._tomar('render', settings.CV_RENDER_SIMULTANEOS)
+        self.addCleanup(lambda: admision._soltar(self.hueco))
+
+    def test_espera_en_cola_hasta_que_se_libera_el_hueco(self):
+        admitida = threading.Event()
+
+        def generar():
+            with admision.turno():
+                admitida.set()
+
+        hilo = threading.Thread(target=generar)
+        hilo.start()
+        for _ in range(50):
+            if admision.estadisticas()['en_cola']:
+                break
+            time.sleep(0.02)
+        self.assertEqual(admision.estadisticas()['en_cola'], 1)
+        self.assertFalse(admitida.is_set())
+
+        admision._soltar(self.hueco)
+        self.hueco = None
+        hilo.join(timeout=5)
+        self.assertTrue(admitida.is_set())
+        self.assertEqual(admision.estadisticas()['en_cola'], 0)
+
+    def test_rechazo_al_agotar_la_espera(self):
+        with self.assertRaises(admision.Saturado):
+            with admision.turno():
+                pass
+        self.assertEqual(admision.estadisticas()['rechazadas'], 1)
+
+    def test_rechazo_inmediato_con_la_cola_llena(self):
+        espera = admision._tomar('cola', settings.CV_RENDER_COLA)
+        self.addCleanup(admision._soltar, espera)
+        with self.assertRaises(admision.Saturado):
+            with admision.turno():
+                pass
+
+    def test_la_vista_responde_503_con_retry_after(self):
+        espera = admision._tomar('cola', settings.CV_RENDER_COLA)
+        self.addCleanup(admision._soltar, espera)
+        response = self.client.get(reverse('descargar_pdf'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.CV_RENDER_ESPERA))
+
+
+class StorageLocal(BaseHTTPRequestHandler):
+    """
+    Sustituto local del storage remoto: un certificado PDF con ETag, un ZIP
+    subido por error, PDFs que tardan en responder (`esperas`, en segundos) y
+    otros enviados sin Content-Length (`sin_longitud`, el cuerpo termina al
+    cerrar la conexión).
+    """
+    archivos = {
+        '/certificado.pdf': pdf_vacio(),
+        '/certificado.zip': b'PK\x03\x04' + b'\0' * (2 * 1024 * 1024),
+        '/escaneo.pdf': b'%PDF' + b'\0' * (2 * 1024 * 1024),
+        '/lento.pdf': b'%PDF lento',
+        '/medio.pdf': b'%PDF medio',
+        '/rapido.pdf': b'%PDF rapido',
+        '/generado.pdf': b'%PDF' + b'\0' * (2 * 1024 * 1024),
+    }
+    esperas = {'/lento.pdf': 0.6, '/medio.pdf': 0.3}
+    sin_longitud = {'/generado.pdf'}
+
+    def do_GET(self):
+        self.server.peticiones.append((self.path, self.headers.get('If-None-Match')))
+        time.sleep(self.esperas.get(self.path, 0))
+        contenido = self.archivos[self.path]
+        etag = f'"{len(contenido)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        if self.path not in self.sin_longitud:
+            self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        try:
+            self.wfile.write(contenido)
+        except OSError:
+            pass  # el cliente cortó la descarga
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(CV_ANEXOS_CACHE_FRESCURA=0)
+class CacheAnexosTests(DirectorioTemporalMixin, TestCase):
+    ajustes_directorio = ('CV_ANEXOS_CACHE_DIR',)
+
+    def setUp(self):
+        super().setUp()
+        anexos._cache = None
+        self.addCleanup(setattr, anexos, '_cache', None)
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), StorageLocal)
+        self.servidor.peticiones = []
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+
+    def url(self, ruta):
+        return f'http://127.0.0.1:{self.servidor.server_port}{ruta}'
+
+    def test_descarga_y_revalidacion_con_etag(self):
+        primera = anexos.descargar('certificado.pdf', self.url('/certificado.pdf'))
+        self.assertTrue(primera.es_pdf)
+        self.assertIsNotNone(anexos.cache_anexos().obtener('certificado.pdf'))
+
+        # Sin frescura cada uso pregunta al servidor, que responde 304 sin cuerpo
+        segunda = anexos.descargar('certificado.pdf', self.url('/certificado.pdf'))
+        self.assertEqual(segunda.ruta, primera.ruta)
+        with open(segunda.ruta, 'rb') as f:
+            self.assertEqual(f.read(), StorageLocal.archivos['/certificado.pdf'])
+        etag = f'"{len(StorageLocal.archivos["/certificado.pdf"])}"'
+        self.assertEqual(self.servidor.peticiones, [('/certificado.pdf', None), ('/certificado.pdf', etag)])
+
+    @override_settings(CV_RECURSOS_MAX_MB=1)
+    def test_recurso_remoto_con_tamano_maximo(self):
+        with override_settings(CV_RECURSOS_DIR=os.path.join(self.directorio, 'recursos')):
+            self.assertIsNone(imagenes.recurso_remoto(self.url('/certificado.zip')))
+            # Ni la copia ni su temporal quedan en disco
+            self.assertEqual(os.listdir(settings.CV_RECURSOS_DIR), [])
+            self.assertTrue(imagenes.recurso_remoto(self.url('/certificado.pdf')))
+
+    def test_corta_la_descarga_si_no_es_pdf(self):
+        anexo = anexos.descargar('certificado.zip', self.url('/certificado.zip'))
+        self.assertFalse(anexo.es_pdf)
+        self.assertEqual(anexo.tamano, len(StorageLocal.archivos['/certificado.zip']))
+        # Solo se conservó el comienzo y nada queda en la caché
+        self.assertEqual(len(anexo.contenido), 4)
+        self.assertIsNone(anexos.cache_anexos().obtener('certificado.zip'))
+
+    @override_settings(CV_ANEXOS_MAX_MB=1)
+    def test_el_tamano_maximo_solo_se_aplica_a_los_pdf(self):
+        # Un ZIP enorme se registra como "no es PDF", no como error que se reintenta
+        anexo = anexos.descargar('certificado.zip', self.url('/certificado.zip'))
+        self.assertIsNone(anexo.error)
+        self.assertFalse(anexo.es_pdf)
+
+        anexo = anexos.descargar('escaneo.pdf', self.url('/escaneo.pdf'))
+        self.assertIn('tamaño máximo', anexo.error)
+        self.assertIsNone(anexos.cache_anexos().obtener('escaneo.pdf'))
+
+    @override_settings(CV_ANEXOS_MAX_MB=1)
+    def test_tamano_maximo_sin_content_length(self):
+        # Sin tamaño declarado el límite se comprueba mientras se descarga
+        anexo = anexos.descargar('generado.pdf', self.url('/generado.pdf'))
+        self.assertIn('tamaño máximo', anexo.error)
+        self.assertIsNone(anexo.flujo)
+        self.assertIsNone(anexos.cache_anexos().obtener('generado.pdf'))
+        self.assertEqual(os.listdir(self.directorio), [])
+
+    def test_descargas_en_paralelo_conservan_el_orden(self):
+        rutas = ['/lento.pdf', '/rapido.pdf', '/medio.pdf']
+        campos = [SimpleNamespace(name=ruta.lstrip('/'), url=self.url(ruta)) for ruta in rutas]
+
+        inicio = time.monotonic()
+        leidos = anexos.leer_anexos(campos)
+        duracion = time.monotonic() - inicio
+
+        # El orden es el de los campos, no el de llegada
+        for ruta, anexo in zip(rutas, leidos):
+            with open(anexo.ruta, 'rb') as f:
+                self.assertEqual(f.read(), StorageLocal.archivos[ruta])
+        # Se espera a la más lenta, no a la suma de todas
+        self.assertLess(duracion, sum(StorageLocal.esperas.values()))
+
+
+class AnexosLocalesTests(DirectorioTemporalMixin, TestCase):
+    def test_se_proyectan_en_memoria_sin_copiarlos(self):
+        ruta = os.path.join(self.directorio, 'certificado.pdf')
+        with open(ruta, 'wb') as f:
+            f.write(pdf_vacio())
+        campo = SimpleNamespace(name='experiencia/certificado.pdf', url='/media/experiencia/certificado.pdf', path=ruta)
+
+        anexo = anexos.leer_anexo(campo)
+        self.assertEqual(anexo.ruta, ruta)
+        self.assertIsNone(anexo.contenido)
+        self.assertTrue(anexo.es_pdf)
+
+        flujo = anexo.abrir()
+        self.addCleanup(flujo.close)
+        self.assertIsInstance(flujo, mmap.mmap)
+        self.assertEqual(len(PdfReader(flujo).pages), 1)
+
+    def test_archivo_vacio(self):
+        ruta = os.path.join(self.directorio, 'vacio.pdf')
+        open(ruta, 'wb').close()
+        # mmap no admite archivos de tamaño cero
+        self.assertEqual(anexos.Anexo('vacio.pdf', ruta=ruta).abrir().read(), b'')
+
+
+class BenchmarkIndicesTests(TestCase):
+    def test_mide_con_los_indices_parciales(self):
+        # handle() crea su propia base de datos; aquí basta con la de pruebas
+        comando = benchmark_indices.Command()
+        random.seed(1)
+        comando.sembrar({'filas': 200, 'inactivas': 0.1})
+        resultados = comando.medir({'repeticiones': 1})
+
+        self.assertEqual(set(resultados), {modelo._meta.model_name for modelo in benchmark_indices.MODELOS})
+        experiencia = resultados['experiencialaboral']
+        self.assertEqual(set(experiencia), {'pagina', 'claves', 'completa'})
+        self.assertIn('experiencia_activa_fecha_idx', experiencia['pagina']['plan'])
+        self.assertGreaterEqual(experiencia['pagina']['p95_ms'], experiencia['pagina']['p50_ms'])
+
+
+class ArchivosTests(DirectorioTemporalMixin, TestCase):
+    def test_escritura_atomica_sin_restos_si_falla(self):
+        ruta = os.path.join(self.directorio, 'cv.pdf')
+        with self.assertRaises(ValueError):
+            with archivos.escritura_atomica(ruta) as f:
+                f.write(b'%PDF a medias')
+                raise ValueError()
+        self.assertEqual(os.listdir(self.directorio), [])
+
+        with archivos.escritura_atomica(ruta) as f:
+            f.write(b'%PDF')
+        self.assertEqual(os.listdir(self.directorio), ['cv.pdf'])
+
+    def test_podar_conserva_los_mas_recientes(self):
+        for i in range(5):
+            ruta = os.path.join(self.directorio, f'{i}.pdf')
+            with open(ruta, 'wb'):
+                pass
+            os.utime(ruta, (i, i))
+        archivos.podar(self.directorio, 2)
+        self.assertEqual(sorted(os.listdir(self.directorio)), ['3.pdf', '4.pdf'])
+
+
+class LinkCallbackTests(DirectorioTemporalMixin, TestCase):
+    ajustes_directorio = ('CV_PDF_DERIVADOS_DIR',)
+
+    def setUp(self):
+        super().setUp()
+        self.derivado = os.path.join(self.directorio, 'foto.jpg')
+        with open(self.derivado, 'wb'):
+            pass
+        os.utime(self.derivado, (0, 0))
+        render._resueltas.clear()
+        self.addCleanup(render._resueltas.clear)
+
+    @mock.patch('curriculum.render._resolver')
+    def test_acierto_renueva_el_derivado_y_comprueba_que_existe(self, resolver):
+        resolver.return_value = self.derivado
+        render.link_callback('/media/foto.jpg', None)
+        os.utime(self.derivado, (0, 0))
+        self.assertEqual(render.link_callback('/media/foto.jpg', None), self.derivado)
+        self.assertGreater(os.path.getmtime(self.derivado), 0)
+        self.assertEqual(resolver.call_count, 1)
+
+        # La poda lo borró: se resuelve de nuevo en lugar de devolver una ruta inexistente
+        os.remove(self.derivado)
+        resolver.return_value = render.NO_DISPONIBLE
+        self.assertEqual(render.link_callback('/media/foto.jpg', None), render.NO_DISPONIBLE)
+        self.assertEqual(resolver.call_count, 2)
+
+    @mock.patch('curriculum.render.MAX_RESUELTAS', 2)
+    @mock.patch('curriculum.render._resolver', return_value=render.NO_DISPONIBLE)
+    def test_fallidas_acotadas(self, resolver):
+        self.addCleanup(render._fallidas.clear)
+        for i in range(5):
+            render.link_callback(f'https://example.com/{i}.css', None)
+        self.assertLessEqual(len(render._fallidas), 2)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_TRABAJOS_HILO=False,
+)
+class ColaTests(DirectorioTemporalMixin, TestCase):
+    ajustes_directorio = ('CV_PDF_CACHE_DIR',)
+
+    def test_envios_identicos_comparten_un_trabajo(self):
+        banderas = cv.leer_banderas({})
+        primero = cola.encolar(banderas, 'http://testserver')
+        segundo = cola.encolar(banderas, 'http://testserver')
+        self.assertEqual(primero.id, segundo.id)
+        self.assertEqual(TrabajoPDF.objects.count(), 1)
+
+    def test_solo_se_rescatan_los_trabajos_sin_latido(self):
+        trabajo = cola.encolar(cv.leer_banderas({}), 'http://testserver')
+        self.assertEqual(cola.reclamar().id, trabajo.id)
+        hace_mucho = timezone.now() - datetime.timedelta(seconds=settings.CV_TRABAJOS_MAX_SEGUNDOS + 60)
+
+        # Lleva mucho en proceso (esperando turno, por ejemplo) pero su worker sigue vivo
+        TrabajoPDF.objects.filter(id=trabajo.id).update(fecha_inicio=hace_mucho, latido=timezone.now())
+        self.assertIsNone(cola.reclamar())
+
+        # El worker dejó de latir: otro lo retoma
+        TrabajoPDF.objects.filter(id=trabajo.id).update(latido=hace_mucho)
+        self.assertEqual(cola.reclamar().id, trabajo.id)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CV_TRABAJOS_HILO=False,
+    CV_TRABAJOS_LATIDO=0.05,
+)
+class LatidoTests(TransactionTestCase):
+    # El hilo del latido escribe con su propia conexión: sin la transacción de TestCase
+    def test_el_latido_se_renueva_mientras_se_procesa(self):
+        trabajo = cola.encolar(cv.leer_banderas({}), 'http://testserver')
+        cola.reclamar()
+        TrabajoPDF.objects.filter(id=trabajo.id).update(latido=None)
+        with cola._latiendo(trabajo):
+            time.sleep(0.2)
+        self.assertIsNotNone(TrabajoPDF.objects.get(id=trabajo.id).latido)
+
+
+@override_settings(CV_RENDER_PROCESOS=2)
+class ProcesosRenderTests(TestCase):
+    def setUp(self):
+        render._procesos = None
+        self.addCleanup(self.terminar)
+
+    def terminar(self):
+        libres, render._procesos = render._procesos, None
+        while libres is not None and not libres.empty():
+            libres.get().terminar()
+
+    def libres(self):
+        return list(render._libres().queue)
+
+    def test_un_render_colgado_solo_termina_su_proceso(self):
+        primero, segundo = self.libres()
+        # Ningún render cabe en un milisegundo (el proceso ni siquiera terminó de arrancar)
+        with override_settings(CV_RENDER_TIMEOUT=0.001):
+            with self.assertRaisesMessage(render.ErrorRender, 'tardó demasiado'):
+                render.renderizar_pdf('<p>CV</p>')
+        self.assertFalse(primero.proceso.is_alive())
+        restantes = self.libres()
+        self.assertEqual(len(restantes), 2)
+        self.assertIn(segundo, restantes)
+        self.assertTrue(segundo.proceso.is_alive())
+
+        # El proceso nuevo y el que no se tocó siguen generando PDFs
+        with override_settings(CV_RENDER_TIMEOUT=60):
+            for _ in range(2):
+                self.assertTrue(render.renderizar_pdf('<p>CV</p>').startswith(b'%PDF'))
+
+    @override_settings(CV_RENDER_PROCESOS=1)
+    def test_proceso_caido_se_reemplaza(self):
+        caido, = self.libres()
+        caido.proceso.kill()
+        caido.proceso.join()
+        with self.assertRaisesMessage(render.ErrorRender, 'terminó inesperadamente'):
+            render.renderizar_pdf('<p>CV</p>')
+        nuevo, = self.libres()
+        self.assertIsNot(nuevo, caido)
+        self.assertTrue(nuevo.proceso.is_alive())
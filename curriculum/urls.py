@@ -9,7 +9,9 @@ urlpatterns = [
     path('cursos/', views.cursos, name='cursos'),
     path('reconocimientos/', views.reconocimientos, name='reconocimientos'),
     path('trabajos/', views.trabajos, name='trabajos'),
+    path('trabajos/mas/', views.trabajos_mas, name='trabajos_mas'),
     path('venta/', views.venta, name='venta'),
+    path('venta/mas/', views.venta_mas, name='venta_mas'),
     path('contacto/', views.contacto, name='contacto'),
 
     # 1. Ruta para VER la pantalla de configuración (los checkboxes)
@@ -17,6 +19,12 @@ urlpatterns = [
 
     # 2. Ruta para PROCESAR y DESCARGAR el PDF (esta faltaba)
     path('descargar-pdf/', views.generar_cv, name='descargar_pdf'),
+
+    # 3. Modo asíncrono: encolar la generación, consultar el estado y descargar
+    path('descargar-pdf/trabajos/', views.encolar_cv, name='encolar_cv'),
+    path('descargar-pdf/trabajos/<uuid:id_trabajo>/', views.estado_cv, name='estado_cv'),
+    path('descargar-pdf/trabajos/<uuid:id_trabajo>/pdf/', views.descargar_trabajo_cv, name='descargar_trabajo_cv'),
+    path('descargar-pdf/capacidad/', views.capacidad_cv, name='capacidad_cv'),
     path('venta/', views.venta, name='venta'),
     path('checkout/', views.checkout, name='checkout'), # <-- Agrega esta línea
 ]
\ No newline at end of file
@@ -0,0 +1,38 @@
+import hashlib
+import uuid
+from django.core.cache import cache
+
+PREFIJO = 'version'
+
+
+def _clave(modelo):
+    return f"{PREFIJO}:{modelo._meta.label_lower}"
+
+
+def invalidar(modelo):
+    """Asigna un token nuevo al modelo; todo lo derivado de la versión anterior queda obsoleto."""
+    cache.set(_clave(modelo), uuid.uuid4().hex, None)
+
+
+def tokens(*modelos):
+    """
+    Token actual de cada modelo, con una sola lectura de la caché: {modelo: token}.
+
+    Los tokens viven en la caché compartida y los renuevan las señales de
+    signals.py. Si un token no existe (caché vaciada) se crea uno nuevo, lo que
+    solo provoca un fallo de caché, nunca datos viejos.
+    """
+    claves = [_clave(m) for m in modelos]
+    encontrados = cache.get_many(claves)
+    for clave in claves:
+        if clave not in encontrados:
+            nuevo = uuid.uuid4().hex
+            cache.add(clave, nuevo, None)
+            encontrados[clave] = cache.get(clave) or nuevo
+    return {modelo: encontrados[clave] for modelo, clave in zip(modelos, claves)}
+
+
+def version_datos(*modelos):
+    """Devuelve una huella de la versión actual de los modelos indicados."""
+    huella = '|'.join(tokens(*modelos).values())
+    return hashlib.sha256(huella.encode()).hexdigest()
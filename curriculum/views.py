@@ -1,251 +1,362 @@
 import os
-import io
-import requests
-from pypdf import PdfWriter, PdfReader
+import time
+import tempfile
+from urllib.parse import quote
 from django.conf import settings
-from django.shortcuts import render
-from django.http import HttpResponse
-from django.template.loader import get_template
-from xhtml2pdf import pisa
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse, JsonResponse, Http404
+from django.db.models import Prefetch
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_POST
+from . import admision, anexos, cache_pdf, cv, generador, cola, instantanea, paginacion
+from .paginas import cachear_pagina
+from .metricas import Cronometro
+from .render import ErrorRender
 from .models import (
-    DatosPersonales, ExperienciaLaboral, EstudioRealizado, 
+    Idioma, ExperienciaLaboral, EstudioRealizado, 
     CursoCapacitacion, Reconocimiento, ProductoAcademico, VentaGarage,
-    ConfiguracionPagina
+    CategoriaTag, TrabajoPDF
 )
 
-def link_callback(uri, rel):
-    """
-    Convierte las URIs de Django (static y media) en rutas de archivos absolutas
-    para que xhtml2pdf pueda encontrarlas en el sistema de archivos.
-    """
-    sUrl = settings.STATIC_URL
-    sRoot = settings.STATIC_ROOT
-    mUrl = settings.MEDIA_URL
-    mRoot = settings.MEDIA_ROOT
-
-    if uri.startswith(mUrl):
-        path = os.path.join(mRoot, uri.replace(mUrl, ""))
-    elif uri.startswith(sUrl):
-        path = os.path.join(sRoot, uri.replace(sUrl, ""))
-    else:
-        return uri
-
-    # Asegurarse de que path es una cadena válida antes de verificar si es archivo
-    if not os.path.isfile(path):
-        return uri
-    return path
-
 def get_visibilidad():
-    """Helper para obtener la configuración de visibilidad o un valor por defecto seguro."""
-    return ConfiguracionPagina.objects.first()
+    """Helper para obtener la configuración de visibilidad (instantánea del proceso, sin consulta)."""
+    return instantanea.visibilidad()
 
+@cachear_pagina()
 def inicio(request):
     # CORRECCIÓN: Usamos .first() en lugar de filtrar por mostrar_seccion.
     # Si ocultas la sección, quieres que desaparezca el bloque de contenido, 
     # pero NO el nombre/foto del header que se usa en base.html.
-    perfil = DatosPersonales.objects.first()
+    perfil = instantanea.perfil()
     return render(request, 'curriculum/inicio.html', {
         'perfil': perfil, 
         'secciones': get_visibilidad()
     })
 
+@cachear_pagina(Idioma)
 def perfil(request):
-    perfil = DatosPersonales.objects.first()
+    perfil = instantanea.perfil()
     return render(request, 'curriculum/datos_personales.html', {
         'perfil': perfil, 
         'secciones': get_visibilidad()
     })
 
+@cachear_pagina(ExperienciaLaboral)
 def experiencia(request):
-    perfil = DatosPersonales.objects.first()
-    experiencias = ExperienciaLaboral.objects.filter(activo=True)
+    perfil = instantanea.perfil()
+    experiencias = ExperienciaLaboral.objects.filter(activo=True).only(
+        'cargo', 'empresa', 'fecha_inicio', 'fecha_fin', 'descripcion', 'modalidad',
+        'telefono_contacto', 'nombre_contacto', 'certificado_pdf',
+    )
     return render(request, 'curriculum/experiencia.html', {
         'perfil': perfil, 
         'experiencias': experiencias,
         'secciones': get_visibilidad()
     })
 
+@cachear_pagina(EstudioRealizado)
 def educacion(request):
-    perfil = DatosPersonales.objects.first()
-    estudios = EstudioRealizado.objects.filter(activo=True)
+    perfil = instantanea.perfil()
+    estudios = EstudioRealizado.objects.filter(activo=True).only(
+        'titulo', 'institucion', 'fecha_inicio', 'fecha_fin', 'certificado_pdf',
+    )
     return render(request, 'curriculum/educacion.html', {
         'perfil': perfil, 
         'estudios': estudios,
         'secciones': get_visibilidad()
     })
 
+@cachear_pagina(CursoCapacitacion)
 def cursos(request):
-    perfil = DatosPersonales.objects.first()
-    cursos = CursoCapacitacion.objects.filter(activo=True)
+    perfil = instantanea.perfil()
+    cursos = CursoCapacitacion.objects.filter(activo=True).only(
+        'nombre_curso', 'institucion', 'fecha_realizacion', 'horas', 'certificado_pdf',
+    )
     return render(request, 'curriculum/cursos.html', {
         'perfil': perfil, 
         'cursos': cursos,
         'secciones': get_visibilidad()
     })
 
+@cachear_pagina(Reconocimiento)
 def reconocimientos(request):
-    perfil = DatosPersonales.objects.first()
-    reconocimientos = Reconocimiento.objects.filter(activo=True)
+    perfil = instantanea.perfil()
+    reconocimientos = Reconocimiento.objects.filter(activo=True).only(
+        'nombre', 'institucion', 'fecha_obtencion', 'codigo_registro',
+    )
     return render(request, 'curriculum/reconocimientos.html', {
         'perfil': perfil, 
         'reconocimientos': reconocimientos,
         'secciones': get_visibilidad()
     })
 
+def _proyectos():
+    # Las categorías de todos los proyectos en una sola consulta (no una por tarjeta)
+    return ProductoAcademico.objects.filter(activo=True).only(
+        'nombre', 'descripcion', 'registro_id', 'fecha_publicacion', 'archivo',
+    ).prefetch_related(Prefetch('categorias', queryset=CategoriaTag.objects.only('nombre')))
+
+def _productos():
+    return VentaGarage.objects.filter(activo=True).only(
+        'nombre_producto', 'descripcion', 'precio', 'estado', 'imagen', 'fecha_publicacion', 'stock',
+    )
+
+def _fragmento(request, plantilla, contexto, siguiente):
+    """Tarjetas de la página siguiente; el cursor de la otra va en X-Siguiente (vacío al final)."""
+    response = render(request, plantilla, contexto)
+    if siguiente:
+        response['X-Siguiente'] = siguiente
+    return response
+
+@cachear_pagina(ProductoAcademico, CategoriaTag)
 def trabajos(request):
-    perfil = DatosPersonales.objects.first()
-    proyectos = ProductoAcademico.objects.filter(activo=True)
+    perfil = instantanea.perfil()
+    proyectos, siguiente = paginacion.pagina(_proyectos(), request.GET.get('despues'))
     return render(request, 'curriculum/proyectos.html', {
         'perfil': perfil, 
         'proyectos': proyectos,
+        'siguiente': siguiente,
         'secciones': get_visibilidad()
     })
 
+def trabajos_mas(request):
+    proyectos, siguiente = paginacion.pagina(_proyectos(), request.GET.get('despues'))
+    return _fragmento(request, 'curriculum/proyectos_mas.html', {'proyectos': proyectos}, siguiente)
+
+@cachear_pagina(VentaGarage)
 def venta(request):
-    perfil = DatosPersonales.objects.first()
-    productos = VentaGarage.objects.filter(activo=True) 
+    perfil = instantanea.perfil()
+    productos, siguiente = paginacion.pagina(_productos(), request.GET.get('despues'))
     context = {
         'perfil': perfil,
         'productos': productos,
+        'siguiente': siguiente,
         'secciones': get_visibilidad()
     }
     # CORRECCIÓN: Cambiado de 'venta_garage.html' a 'venta.html' para coincidir con tu archivo
     return render(request, 'curriculum/venta.html', context)
 
+def venta_mas(request):
+    productos, siguiente = paginacion.pagina(_productos(), request.GET.get('despues'))
+    return _fragmento(request, 'curriculum/venta_mas.html', {'productos': productos}, siguiente)
+
+@cachear_pagina()
 def contacto(request):
-    perfil = DatosPersonales.objects.first()
+    perfil = instantanea.perfil()
     return render(request, 'curriculum/contacto.html', {
         'perfil': perfil, 
         'secciones': get_visibilidad()
     })
 
 def configurar_cv(request):
-    perfil = DatosPersonales.objects.first()
-    return render(request, 'curriculum/configurar_cv.html', {'perfil': perfil})
+    perfil = instantanea.perfil()
+    # Páginas de anexos conocidas de antemano gracias al análisis hecho al subir cada archivo
+    nombres = list(ExperienciaLaboral.objects.filter(activo=True).values_list('certificado_pdf', flat=True))
+    nombres += EstudioRealizado.objects.filter(activo=True).values_list('certificado_pdf', flat=True)
+    nombres += ProductoAcademico.objects.filter(activo=True).values_list('archivo', flat=True)
+    nombres += CursoCapacitacion.objects.filter(activo=True).values_list('certificado_pdf', flat=True)
+    paginas_anexos = anexos.paginas_esperadas(nombres)
+    return render(request, 'curriculum/configurar_cv.html', {
+        'perfil': perfil,
+        'paginas_anexos': paginas_anexos,
+    })
 
 def checkout(request):
-    perfil = DatosPersonales.objects.first()
+    perfil = instantanea.perfil()
     return render(request, 'curriculum/checkout.html', {
         'perfil': perfil,
         'secciones': get_visibilidad()
     })
 
+def _rango(request, tamano, clave):
+    """
+    Rango de bytes pedido con la cabecera Range: (inicio, fin), None para enviar
+    el archivo entero o False si el rango no se puede satisfacer (416).
+
+    Solo se atiende un rango simple, que es lo que piden los visores de PDF.
+    """
+    cabecera = request.headers.get('Range', '')
+    if not cabecera.startswith('bytes=') or ',' in cabecera:
+        return None
+    # If-Range: solo se envía un trozo si el navegador tiene esta misma versión
+    si_rango = request.headers.get('If-Range')
+    if si_rango and si_rango != quote_etag(clave):
+        return None
+    inicio, _, fin = cabecera[len('bytes='):].strip().partition('-')
+    try:
+        if not inicio:
+            # bytes=-N: los últimos N bytes (donde el visor busca la tabla xref)
+            sufijo = int(fin)
+            return (max(0, tamano - sufijo), tamano - 1) if sufijo else False
+        inicio = int(inicio)
+        fin = int(fin) if fin else tamano - 1
+    except ValueError:
+        return None
+    if inicio >= tamano or fin < inicio:
+        return False
+    return inicio, min(fin, tamano - 1)
+
+def _parcial(ruta, inicio, fin, tamano):
+    archivo = open(ruta, 'rb')
+    archivo.seek(inicio)
+
+    def bloques():
+        restante = fin - inicio + 1
+        with archivo:
+            while restante > 0:
+                bloque = archivo.read(min(64 * 1024, restante))
+                if not bloque:
+                    return
+                restante -= len(bloque)
+                yield bloque
+
+    response = StreamingHttpResponse(bloques(), status=206, content_type='application/pdf')
+    response['Content-Length'] = str(fin - inicio + 1)
+    response['Content-Range'] = f"bytes {inicio}-{fin}/{tamano}"
+    response['Content-Disposition'] = 'inline; filename="Hoja_de_Vida.pdf"'
+    return response
+
+def respuesta_pdf(ruta, request=None, clave=None):
+    """
+    PDF completo ya escrito en disco. Con `clave` (documento en caché) se
+    añaden ETag y Cache-Control y se atienden peticiones Range, con las que el
+    navegador muestra un PDF linealizado sin esperar a los anexos.
+    """
+    if request is None or clave is None:
+        return FileResponse(open(ruta, 'rb'), content_type='application/pdf', filename='Hoja_de_Vida.pdf')
+
+    tamano = os.path.getsize(ruta)
+    rango = _rango(request, tamano, clave)
+    if rango is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{tamano}"
+        return response
+    if rango:
+        response = _parcial(ruta, *rango, tamano)
+    else:
+        response = FileResponse(open(ruta, 'rb'), content_type='application/pdf', filename='Hoja_de_Vida.pdf')
+    response['Accept-Ranges'] = 'bytes'
+    return cabeceras_cache(response, clave)
+
+def cabeceras_cache(response, clave):
+    """
+    ETag fuerte = huella del documento (banderas + versión de los datos). El
+    navegador guarda el PDF y lo revalida pasado CV_PDF_MAX_AGE; mientras los
+    datos no cambien la revalidación es un 304 sin cuerpo.
+    """
+    response['ETag'] = quote_etag(clave)
+    patch_cache_control(response, private=True, max_age=settings.CV_PDF_MAX_AGE, must_revalidate=True)
+    return response
+
 def generar_cv(request):
-    perfil = DatosPersonales.objects.first()
-    
+    cronometro = Cronometro()
     scheme = request.scheme
     host = request.get_host()
     base_url = f"{scheme}://{host}"
     
     # Captura de parámetros (Banderas booleanas)
-    ocultar_foto = request.GET.get('ocultar_foto') == 'on'
-    ocultar_contacto = request.GET.get('ocultar_contacto') == 'on'
-    ocultar_perfil = request.GET.get('ocultar_perfil') == 'on'
-    ocultar_intereses = request.GET.get('ocultar_intereses') == 'on'
-    ocultar_experiencia = request.GET.get('ocultar_experiencia') == 'on'
-    ocultar_educacion = request.GET.get('ocultar_educacion') == 'on'
-    ocultar_cursos = request.GET.get('ocultar_cursos') == 'on'
-    ocultar_idiomas = request.GET.get('ocultar_idiomas') == 'on'
-    ocultar_redes = request.GET.get('ocultar_redes') == 'on'
-    ocultar_valores = request.GET.get('ocultar_valores') == 'on'
-    ocultar_proyectos = request.GET.get('ocultar_proyectos') == 'on'
-    ocultar_reconocimientos = request.GET.get('ocultar_reconocimientos') == 'on'
-    ocultar_venta = request.GET.get('ocultar_venta') == 'on'
-    ocultar_anexos = request.GET.get('ocultar_anexos') == 'on'
-
-    # CORRECCIÓN: Definimos las variables AQUÍ para usarlas tanto en context como en el loop de anexos
-    experiencias = ExperienciaLaboral.objects.filter(activo=True)
-    estudios = EstudioRealizado.objects.filter(activo=True)
-    proyectos = ProductoAcademico.objects.filter(activo=True)
-    cursos = CursoCapacitacion.objects.filter(activo=True)
-    reconocimientos = Reconocimiento.objects.filter(activo=True)
-    productos_venta = VentaGarage.objects.filter(activo=True)
+    banderas = cv.leer_banderas(request.GET)
 
-    context = {
-        'perfil': perfil,
-        'experiencias': experiencias, # Ahora usamos la variable definida arriba
-        'estudios': estudios,
-        'cursos': cursos,
-        'reconocimientos': reconocimientos,
-        'proyectos': proyectos,
-        'productos': productos_venta,
-        'MEDIA_URL': settings.MEDIA_URL,
-        'base_url': base_url,
-        
-        # Banderas
-        'ocultar_foto': ocultar_foto,
-        'ocultar_contacto': ocultar_contacto,
-        'ocultar_perfil': ocultar_perfil,
-        'ocultar_intereses': ocultar_intereses,
-        'ocultar_experiencia': ocultar_experiencia,
-        'ocultar_educacion': ocultar_educacion,
-        'ocultar_cursos': ocultar_cursos,
-        'ocultar_idiomas': ocultar_idiomas,
-        'ocultar_redes': ocultar_redes,
-        'ocultar_valores': ocultar_valores,
-        'ocultar_proyectos': ocultar_proyectos,
-        'ocultar_reconocimientos': ocultar_reconocimientos,
-        'ocultar_venta': ocultar_venta,
-        'ocultar_anexos': ocultar_anexos,
-    }
-    
-    template = get_template('curriculum/cv_pdf.html')
-    html = template.render(context)
-    
-    cv_buffer = io.BytesIO()
-    pisa_status = pisa.CreatePDF(html, dest=cv_buffer, link_callback=link_callback)
-    
-    if pisa_status.err:
-        return HttpResponse('Hubo un error al generar el PDF principal.', status=500)
-
-    merger = PdfWriter()
-    cv_buffer.seek(0)
-    merger.append(cv_buffer)
-
-    def adjuntar_archivo(campo_archivo):
-        try:
-            if not campo_archivo: return
-            
-            content = None
-            if hasattr(campo_archivo, 'url') and campo_archivo.url.startswith('http'):
-                response = requests.get(campo_archivo.url)
-                if response.status_code == 200:
-                    content = response.content
-            else:
-                try:
-                    with campo_archivo.open('rb') as f:
-                        content = f.read()
-                except Exception:
-                    pass
-
-            if content and content.startswith(b'%PDF'):
-                merger.append(io.BytesIO(content))
-        except Exception as e:
-            print(f"Error adjuntando archivo: {e}")
-
-    # LÓGICA DE FUSIÓN (ANEXOS)
-    if not ocultar_anexos:
-        # CORRECCIÓN: Usamos la variable booleana 'ocultar_experiencia' en lugar de request.GET
-        # Y 'experiencias' ahora está definida correctamente.
-        if not ocultar_experiencia:
-            for exp in experiencias:
-                adjuntar_archivo(exp.certificado_pdf)
-                
-        if not ocultar_educacion:
-            for estudio in estudios:
-                adjuntar_archivo(estudio.certificado_pdf)
-
-        if not ocultar_proyectos:
-            for proyecto in proyectos:
-                adjuntar_archivo(proyecto.archivo)
-                
-        if not ocultar_cursos:
-            for curso in cursos:
-                adjuntar_archivo(curso.certificado_pdf)
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; filename="Hoja_de_Vida.pdf"'
-    
-    merger.write(response)
-    
-    return response
\ No newline at end of file
+    with cronometro.etapa('cache'):
+        clave = cache_pdf.clave_cv(banderas, base_url)
+        # El navegador ya tiene este mismo documento: 304 antes de tocar el disco
+        no_modificado = get_conditional_response(request, etag=quote_etag(clave))
+        ruta = cache_pdf.obtener(clave) if no_modificado is None else None
+    if no_modificado is not None:
+        cronometro.datos['cache'] = 'no_modificado'
+        cronometro.registrar('cv_pdf')
+        return cronometro.aplicar(cabeceras_cache(no_modificado, clave))
+    # Si ya se generó este mismo documento con los mismos datos, se sirve desde disco
+    if ruta:
+        cronometro.datos['cache'] = 'hit'
+        cronometro.registrar('cv_pdf')
+        return cronometro.aplicar(respuesta_pdf(ruta, request, clave))
+    cronometro.datos['cache'] = 'miss'
+
+    try:
+        with admision.turno(cronometro):
+            # El presupuesto cuenta desde que se obtiene turno: la espera en cola no recorta los anexos
+            limite = time.monotonic() + settings.CV_PDF_PRESUPUESTO
+            response = generar_respuesta(request, banderas, base_url, clave, cronometro, limite)
+    except admision.Saturado:
+        cronometro.datos['error'] = 'saturado'
+        response = HttpResponse(
+            "Se están generando otros documentos en este momento. Inténtalo de nuevo en unos segundos.",
+            status=503,
+        )
+        response['Retry-After'] = str(settings.CV_RENDER_ESPERA)
+    cronometro.registrar('cv_pdf')
+    return cronometro.aplicar(response)
+
+def generar_respuesta(request, banderas, base_url, clave, cronometro, limite=None):
+    # Mientras se esperaba turno otra petición pudo generar este mismo documento
+    ruta = cache_pdf.obtener(clave)
+    if ruta:
+        cronometro.datos['cache'] = 'hit'
+        return respuesta_pdf(ruta, request, clave)
+
+    try:
+        merger, errores = generador.generar(banderas, base_url, cronometro, limite)
+    except ErrorRender as e:
+        cronometro.datos['error'] = 'render'
+        return HttpResponse(str(e), status=500)
+
+    # El documento final se escribe en disco y se envía por bloques (FileResponse)
+    with cronometro.etapa('escritura'):
+        if not errores:
+            return respuesta_pdf(cache_pdf.guardar(clave, merger), request, clave)
+        salida = tempfile.TemporaryFile()
+        merger.write(salida)
+        salida.seek(0)
+        response = FileResponse(salida, content_type='application/pdf', filename='Hoja_de_Vida.pdf')
+        # Anexos sustituidos por su enlace (nombres codificados para que la cabecera sea ASCII)
+        response['X-CV-Anexos-Omitidos'] = ', '.join(quote(nombre) for nombre in errores)
+        # Documento degradado: sin ETag y sin guardar, para que la próxima vez se pida completo
+        patch_cache_control(response, no_store=True)
+        return response
+
+@staff_member_required
+def capacidad_cv(request):
+    """Estado del control de admisión (en curso, en cola, rechazadas) para ajustar los límites."""
+    return JsonResponse(admision.estadisticas())
+
+def estado_trabajo(trabajo):
+    """Respuesta JSON con el estado de un trabajo PDF y las URLs para seguirlo."""
+    return JsonResponse({
+        'id': str(trabajo.id),
+        'estado': TrabajoPDF.Estado(trabajo.estado).name.lower(),
+        'error': trabajo.error,
+        'url_estado': reverse('estado_cv', args=[trabajo.id]),
+        'url_descarga': reverse('descargar_trabajo_cv', args=[trabajo.id]),
+    })
+
+@require_POST
+def encolar_cv(request):
+    """Modo asíncrono de descargar_pdf: encola la generación y devuelve el id del trabajo."""
+    base_url = f"{request.scheme}://{request.get_host()}"
+    trabajo = cola.encolar(cv.leer_banderas(request.POST), base_url)
+    response = estado_trabajo(trabajo)
+    response.status_code = 202
+    return response
+
+def estado_cv(request, id_trabajo):
+    trabajo = get_object_or_404(TrabajoPDF.objects.only('estado', 'ruta', 'error', 'clave'), id=id_trabajo)
+    if trabajo.estado == TrabajoPDF.Estado.LISTO and not cola.disponible(trabajo):
+        # El PDF se podó de la caché: se vuelve a encolar (o se reutiliza uno idéntico)
+        trabajo = TrabajoPDF.objects.get(id=id_trabajo)
+        trabajo = cola.encolar(trabajo.banderas, trabajo.base_url)
+    elif trabajo.estado == TrabajoPDF.Estado.PENDIENTE:
+        # Por si el proceso que lo encoló se reinició antes de procesarlo
+        cola.despertar()
+    return estado_trabajo(trabajo)
+
+def descargar_trabajo_cv(request, id_trabajo):
+    trabajo = get_object_or_404(TrabajoPDF, id=id_trabajo)
+    if not cola.disponible(trabajo):
+        raise Http404("El PDF de este trabajo no está disponible.")
+    # Los documentos completos están en la caché de PDFs: mismas cabeceras y Range que la descarga directa
+    completo = os.path.dirname(trabajo.ruta) == settings.CV_PDF_CACHE_DIR
+    return respuesta_pdf(trabajo.ruta, request, trabajo.clave if completo else None)
@@ -62,8 +62,8 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
-                # NOTA: Si este archivo no existe, comentamos la línea para evitar el Error 500
-                # 'curriculum.context_processors.visibilidad_context',
+                # Lee de la instantánea por proceso (curriculum/instantanea.py): sin consultas
+                'curriculum.context_processors.visibilidad_context',
             ],
         },
     },
@@ -79,6 +79,94 @@ DATABASES = {
     )
 }
 
+# --- CACHÉ ---
+# Caché en disco para que todos los workers de gunicorn compartan los mismos
+# sellos de versión de los datos (ver curriculum/versiones.py).
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'django'),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+# PDFs del CV ya generados, nombrados por la huella de banderas + versión de datos
+CV_PDF_CACHE_DIR = os.path.join(CACHE_DIR, 'cv_pdf')
+CV_PDF_CACHE_MAX_ARCHIVOS = int(os.environ.get('CV_PDF_CACHE_MAX_ARCHIVOS', '50'))
+# Segundos que el navegador puede reutilizar el PDF sin revalidarlo (ETag -> 304)
+CV_PDF_MAX_AGE = int(os.environ.get('CV_PDF_MAX_AGE', '0'))
+# Secciones de cv_pdf.html ya renderizadas (la clave lleva la versión de sus datos)
+CV_FRAGMENTOS_TIMEOUT = int(os.environ.get('CV_FRAGMENTOS_TIMEOUT', str(7 * 24 * 3600)))
+# Páginas públicas completas (HTML + gzip/brotli) para visitantes anónimos; 0 las desactiva
+CV_PAGINAS_TIMEOUT = int(os.environ.get('CV_PAGINAS_TIMEOUT', str(7 * 24 * 3600)))
+# Elementos por página en venta y trabajos (el resto se carga al hacer scroll)
+CV_LISTAS_POR_PAGINA = int(os.environ.get('CV_LISTAS_POR_PAGINA', '24'))
+
+# Descarga de anexos: hilos simultáneos y timeout (conexión, lectura) en segundos
+CV_ANEXOS_HILOS = int(os.environ.get('CV_ANEXOS_HILOS', '8'))
+CV_ANEXOS_TIMEOUT = (3.05, float(os.environ.get('CV_ANEXOS_TIMEOUT', '15')))
+# Tamaño máximo de un anexo remoto y parte de la descarga que se mantiene en
+# memoria antes de pasar a un temporal en disco
+CV_ANEXOS_MAX_MB = int(os.environ.get('CV_ANEXOS_MAX_MB', '25'))
+CV_ANEXOS_EN_MEMORIA_MB = int(os.environ.get('CV_ANEXOS_EN_MEMORIA_MB', '2'))
+# Tiempo total de una descarga del CV en segundos; los anexos que no llegan a
+# tiempo (dejando CV_PDF_RESERVA para fusionar y escribir) se sustituyen por su enlace
+CV_PDF_PRESUPUESTO = float(os.environ.get('CV_PDF_PRESUPUESTO', '30'))
+CV_PDF_RESERVA = float(os.environ.get('CV_PDF_RESERVA', '5'))
+
+# Render del PDF principal (xhtml2pdf) en un pool de procesos; 0 = en el mismo proceso
+CV_RENDER_PROCESOS = int(os.environ.get('CV_RENDER_PROCESOS', '2'))
+CV_RENDER_TIMEOUT = int(os.environ.get('CV_RENDER_TIMEOUT', '60'))
+
+# Control de admisión (curriculum/admision.py): generaciones simultáneas entre
+# todos los workers (0 = sin límite), peticiones en espera y segundos de espera
+# antes de responder 503
+CV_RENDER_SIMULTANEOS = int(os.environ.get('CV_RENDER_SIMULTANEOS', '2'))
+CV_RENDER_COLA = int(os.environ.get('CV_RENDER_COLA', '8'))
+CV_RENDER_ESPERA = int(os.environ.get('CV_RENDER_ESPERA', '20'))
+CV_ADMISION_DIR = os.path.join(CACHE_DIR, 'admision')
+
+# Fotos e imágenes reducidas para el PDF (.profile-img mide 130x160 px; ~300 ppp)
+CV_PDF_DERIVADOS_DIR = os.path.join(CACHE_DIR, 'derivados')
+CV_PDF_DERIVADOS_MAX_ARCHIVOS = int(os.environ.get('CV_PDF_DERIVADOS_MAX_ARCHIVOS', '500'))
+CV_PDF_IMAGEN_MAX = (400, 500)
+# Copias locales de recursos remotos (CSS, fuentes, imágenes) que pide xhtml2pdf
+CV_RECURSOS_DIR = os.path.join(CACHE_DIR, 'recursos')
+CV_RECURSOS_MAX_ARCHIVOS = int(os.environ.get('CV_RECURSOS_MAX_ARCHIVOS', '500'))
+CV_RECURSOS_MAX_MB = int(os.environ.get('CV_RECURSOS_MAX_MB', '10'))
+
+# Optimización del PDF final: 'ninguna', 'rapida' (deduplicar objetos y comprimir)
+# o 'maxima' (además reduce imágenes de más de CV_PDF_OPTIMIZACION_MAX_PX)
+CV_PDF_OPTIMIZACION = os.environ.get('CV_PDF_OPTIMIZACION', 'rapida')
+CV_PDF_OPTIMIZACION_MAX_PX = int(os.environ.get('CV_PDF_OPTIMIZACION_MAX_PX', '1600'))
+CV_PDF_OPTIMIZACION_CALIDAD = int(os.environ.get('CV_PDF_OPTIMIZACION_CALIDAD', '75'))
+# PDF final linealizado ("vista web rápida") con pikepdf (requirements.txt);
+# si no está instalado se escribe normal y se avisa en el log
+CV_PDF_LINEALIZADO = os.environ.get('CV_PDF_LINEALIZADO', 'True') == 'True'
+
+# Anexos de cada sección pre-fusionados en segundo plano al subir/cambiar certificados
+CV_PAQUETES_ANEXOS = os.environ.get('CV_PAQUETES_ANEXOS', 'True') == 'True'
+CV_PAQUETES_DIR = os.path.join(CACHE_DIR, 'paquetes')
+
+# Copia local de los anexos remotos (Cloudinary): tamaño máximo y segundos que
+# una copia se usa sin revalidar con el servidor
+CV_ANEXOS_CACHE_DIR = os.path.join(CACHE_DIR, 'anexos')
+CV_ANEXOS_CACHE_MAX_MB = int(os.environ.get('CV_ANEXOS_CACHE_MAX_MB', '200'))
+CV_ANEXOS_CACHE_FRESCURA = int(os.environ.get('CV_ANEXOS_CACHE_FRESCURA', '86400'))
+
+# Generación del PDF en segundo plano (cola en la base de datos). Con
+# CV_TRABAJOS_HILO=False los trabajos solo los procesa `manage.py procesar_trabajos_cv`
+CV_TRABAJOS_HILO = os.environ.get('CV_TRABAJOS_HILO', 'True') == 'True'
+CV_TRABAJOS_DIR = os.path.join(CACHE_DIR, 'trabajos')
+# El worker renueva el latido del trabajo cada CV_TRABAJOS_LATIDO segundos mientras
+# espera turno o genera; si pasan CV_TRABAJOS_MAX_SEGUNDOS sin renovarlo (el worker
+# murió) el trabajo vuelve a la cola
+CV_TRABAJOS_LATIDO = int(os.environ.get('CV_TRABAJOS_LATIDO', '15'))
+CV_TRABAJOS_MAX_SEGUNDOS = int(os.environ.get('CV_TRABAJOS_MAX_SEGUNDOS', '120'))
+CV_TRABAJOS_CONSERVAR_HORAS = int(os.environ.get('CV_TRABAJOS_CONSERVAR_HORAS', '24'))
+
 # --- ARCHIVOS ESTÁTICOS Y MEDIA ---
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -121,4 +209,20 @@ USE_I18N = True
 USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-X_FRAME_OPTIONS = 'SAMEORIGIN'
\ No newline at end of file
+X_FRAME_OPTIONS = 'SAMEORIGIN'
+
+# --- LOGS ---
+# Métricas de generación del CV (curriculum.cv) en la consola, que Render recoge
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'curriculum': {
+            'handlers': ['console'],
+            'level': os.environ.get('CURRICULUM_LOG_LEVEL', 'INFO'),
+        },
+    },
+}